@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import List, Dict, Tuple, Union, Optional, Any, Callable
+
+from selectolax.parser import HTMLParser
+
+from scrape_gpt.parser import SelectolaxParser, header_tags
+from scrape_gpt.site_map import SiteMap, SiteMapEntry, EntryInfo
+
+_words = ["fish", "price", "shipping", "about", "contact", "product", "review", "cart", "menu", "search",
+          "account", "news", "blog", "team", "careers", "support", "terms", "privacy", "stock", "colour",
+          "size", "delivery", "returns", "offer", "sale", "new", "popular", "category", "brand", "model"]
+
+
+def generate_text(rng: random.Random, length: int) -> str:
+    words = []
+    total = 0
+    while total < length:
+        word = rng.choice(_words)
+        words.append(word)
+        total += len(word) + 1
+    return " ".join(words)
+
+
+def generate_html(depth: int = 4, fan_out: int = 4, text_len: int = 80, heading_every: int = 3,
+                  image_every: int = 5, svg_every: int = 7, link_every: int = 4, seed: int = 0) -> str:
+    """
+    Generate a deterministic synthetic HTML page.
+
+    The page is a tree of nested <div>s. Leaves hold paragraphs of text, and headings, images, SVGs and links
+    are mixed in at fixed intervals. Scripts, styles, comments and whitespace-only text are added too so that
+    `remove_unwanted_nodes` has work to do.
+
+    Parameters:
+        depth (int, default=4): Nesting depth of the <div> tree.
+        fan_out (int, default=4): Children per <div>.
+        text_len (int, default=80): Approximate characters per paragraph.
+        heading_every (int, default=3): Every n-th element gets a heading. 0 disables headings.
+        image_every (int, default=5): Every n-th leaf gets an <img>. 0 disables images.
+        svg_every (int, default=7): Every n-th leaf gets an <svg>. 0 disables SVGs.
+        link_every (int, default=4): Every n-th leaf gets a link. 0 disables links.
+        seed (int, default=0): Seed of the text generator, the same arguments always give the same page.
+
+    Returns:
+        str: The HTML document. It has roughly fan_out ** depth leaves.
+    """
+    rng = random.Random(seed)
+    counter = [0]
+
+    def every(n: int) -> bool:
+        return n > 0 and counter[0] % n == 0
+
+    def build(level: int) -> str:
+        counter[0] += 1
+        parts = []
+        if every(heading_every):
+            tag = header_tags[min(level, len(header_tags) - 1)]
+            parts.append(f"<{tag}>{generate_text(rng, 20)}</{tag}>")
+        if level == depth:
+            parts.append(f"<p>{generate_text(rng, text_len)}</p>")
+            if every(image_every):
+                parts.append(f'<img src="/img/{counter[0]}.png" alt="{generate_text(rng, 15)}">')
+            if every(svg_every):
+                parts.append('<svg viewBox="0 0 10 10"><path d="M0 0L10 10"/><path d="M10 0L0 10"/></svg>')
+            if every(link_every):
+                parts.append(f'<a href="/page/{counter[0]}">{generate_text(rng, 10)}</a> <a href="#top">top</a>')
+            return "<div>" + "\n  ".join(parts) + "</div>"
+        for _ in range(fan_out):
+            parts.append(build(level + 1))
+        return "<div>\n  " + "\n  ".join(parts) + "\n</div>"
+
+    body = build(0)
+    return ("<html><head><title>benchmark</title><style>p { color: red; }</style>"
+            "<script>var x = 1;</script></head>"
+            f"<body><!-- generated -->\n{body}\n<script>console.log(x);</script></body></html>")
+
+
+def generate_site_map(depth: int = 3, fan_out: int = 5, sub_targets: int = 2, seed: int = 0) -> SiteMap:
+    """
+    Generate a deterministic `SiteMap` with `fan_out` entries per level, `depth` levels deep.
+
+    Parameters:
+        depth (int, default=3): Levels of entries below the site map.
+        fan_out (int, default=5): Children per entry.
+        sub_targets (int, default=2): Sub targets per entry.
+        seed (int, default=0): Seed of the text generator.
+
+    Returns:
+        SiteMap: The site map. It has fan_out + fan_out ** 2 + ... + fan_out ** depth entries.
+    """
+    rng = random.Random(seed)
+    site_map = SiteMap("https://www.example.com/shop/products", description=generate_text(rng, 40))
+
+    def make_info(label: str) -> EntryInfo:
+        return EntryInfo(label, f"div.{label}", "css", description=generate_text(rng, 30), note=generate_text(rng, 10))
+
+    def build(entry: SiteMapEntry, level: int) -> None:
+        if level == depth:
+            return
+        for i in range(fan_out):
+            sub_info = [make_info(f"sub{j}") for j in range(sub_targets)]
+            child = entry.create_child(make_info(f"{entry.info.content_label}_{i}"), sub_target_info=sub_info)
+            build(child, level + 1)
+
+    for i in range(fan_out):
+        entry = site_map.create_entry(make_info(f"entry{i}"))
+        entry.sub_target_info = [make_info(f"sub{j}") for j in range(sub_targets)]
+        build(entry, 1)
+    return site_map
+
+
+# a benchmark is either a function timed as is, or a (setup, func) pair where only func(setup()) is timed
+Benchmark = Union[Callable[[], Any], Tuple[Callable[[], Any], Callable[[Any], Any]]]
+
+
+def time_function(func: Callable[..., Any], repeats: int = 5, warmup: int = 1,
+                  setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """
+    Time `func`. If `setup` is given, it is called before every run, outside the timing, and its result is passed to `func`.
+    """
+    def run_once() -> float:
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        run_once()
+    timings = [run_once() for _ in range(repeats)]
+    return {"min": min(timings), "median": statistics.median(timings), "mean": statistics.mean(timings), "repeats": repeats}
+
+
+def create_tiny_scraper(seed: int = 0):
+    """
+    Create an `LlmScraper` holding a tiny randomly initialized BERT, so `text_retrieval` can be timed offline.
+    """
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    from scrape_gpt.scraper import LlmScraper
+
+    torch.manual_seed(seed)
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(_words + ["retrieve", "similar"]))
+    config = BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=128, max_position_embeddings=128)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vocab_file = os.path.join(tmp_dir, "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(vocab))
+        # truncate to the position embeddings, longer inputs would index past them
+        tokenizer = BertTokenizerFast(vocab_file=vocab_file, model_max_length=config.max_position_embeddings)
+
+    model = BertModel(config).eval()
+    return LlmScraper(load_retrieval_model=False, model=model, tokenizer=tokenizer)
+
+
+def get_benchmarks(html: str, site_map: SiteMap, include_retrieval: bool = True) -> Dict[str, Benchmark]:
+    parser = SelectolaxParser(html)
+    root = parser.tree.root
+    benchmarks = {
+        "parser.construct": lambda: SelectolaxParser(html),
+        "parser.parse": lambda: HTMLParser(html),
+        "parser.remove_unwanted_nodes": (lambda: SelectolaxParser(html, clean=False), lambda parser: parser.remove_unwanted_nodes()),
+        "parser.conditional_traverse": lambda: sum(1 for _ in parser.conditional_traverse(root)),
+        "parser.traverse_text_nodes": lambda: sum(1 for _ in parser.traverse_text_nodes(root)),
+        "parser.traverse_media_nodes": lambda: sum(1 for _ in parser.traverse_media_nodes(root)),
+        "parser.parse_media_nodes": lambda: sum(1 for _ in parser.parse_media_nodes(root)),
+        "parser.get_headings": lambda: parser.get_headings(root),
+        "parser.get_links": lambda: parser.get_links(root),
+        "parser.count_nodes": lambda: parser.count_nodes(root),
+        "parser.get_text_nodes": lambda: parser.get_text_nodes(root),
+        "parser.get_text_lens": lambda: parser.get_text_lens(root),
+        "parser.get_media_paths": lambda: parser.get_media_paths(root),
+        "parser.get_subtree_hashes": lambda: parser.get_subtree_hashes(root),
+        "site_map.get_llm_view": lambda: site_map.get_llm_view(include_children=True, include_sub_targets=True),
+    }
+
+    if include_retrieval:
+        corpus = [node.text_content.strip() for node in parser.get_text_nodes(root)]
+        queries = ["product price", "shipping and returns"]
+        scraper = []
+
+        # built on first use, so runs excluding the benchmark with --only don't need torch
+        def get_scraper():
+            if not scraper:
+                scraper.append(create_tiny_scraper())
+            return scraper[0]
+
+        benchmarks["scraper.text_retrieval"] = (get_scraper, lambda scraper: scraper.text_retrieval(queries, corpus, top_k=min(5, len(corpus))))
+    return benchmarks
+
+
+def run_benchmarks(benchmarks: Dict[str, Benchmark], repeats: int = 5, warmup: int = 1,
+                   only: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, benchmark in benchmarks.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        if isinstance(benchmark, tuple):
+            setup, func = benchmark
+            results[name] = time_function(func, repeats, warmup, setup)
+        else:
+            results[name] = time_function(benchmark, repeats, warmup)
+    return results
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                        threshold: float = 1.1) -> Dict[str, Dict[str, Any]]:
+    """
+    Compare benchmark results against a baseline run.
+
+    Parameters:
+        results (Dict[str, Dict[str, float]]): The current results, as returned by `run_benchmarks`.
+        baseline (Dict[str, Dict[str, float]]): The "results" of an earlier json report.
+        threshold (float, default=1.1): A benchmark whose median is more than this factor slower than the baseline is a regression.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Per benchmark present in both runs, the "ratio" of the medians and whether it is a "regression".
+    """
+    comparison = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median"] / baseline[name]["median"] if baseline[name]["median"] else float("inf")
+        comparison[name] = {"ratio": ratio, "regression": ratio > threshold}
+    return comparison
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Benchmark scrape_gpt hot paths on synthetic pages.")
+    arg_parser.add_argument("--depth", type=int, default=4)
+    arg_parser.add_argument("--fan-out", type=int, default=4)
+    arg_parser.add_argument("--text-len", type=int, default=80)
+    arg_parser.add_argument("--site-map-depth", type=int, default=3)
+    arg_parser.add_argument("--site-map-fan-out", type=int, default=5)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--repeats", type=int, default=5)
+    arg_parser.add_argument("--warmup", type=int, default=1)
+    arg_parser.add_argument("--only", nargs="*", help="Only run benchmarks whose name starts with one of these prefixes.")
+    arg_parser.add_argument("--no-retrieval", action="store_true", help="Skip the text_retrieval benchmark, it needs torch.")
+    arg_parser.add_argument("--output", help="Write the json report here instead of stdout.")
+    arg_parser.add_argument("--baseline", help="Json report of an earlier run to compare against.")
+    arg_parser.add_argument("--threshold", type=float, default=1.1)
+    arg_parser.add_argument("--fail-on-regression", action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    html = generate_html(args.depth, args.fan_out, args.text_len, seed=args.seed)
+    site_map = generate_site_map(args.site_map_depth, args.site_map_fan_out, seed=args.seed)
+    benchmarks = get_benchmarks(html, site_map, include_retrieval=not args.no_retrieval)
+    results = run_benchmarks(benchmarks, args.repeats, args.warmup, args.only)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "html_bytes": len(html),
+                 "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "fail_on_regression")}},
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare_to_baseline(results, json.load(f)["results"], args.threshold)
+
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report_json)
+    else:
+        print(report_json)
+
+    regressions = [name for name, info in report.get("comparison", {}).items() if info["regression"]]
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import hashlib
+import random
+import re
+from typing import List, Tuple, Dict, Optional, Iterable
+
+_whitespace_re = re.compile(r"\s+")
+_token_re = re.compile(r"\w+")
+
+_max_hash = (1 << 61) - 1  # mersenne prime used for the minhash permutations
+
+
+def normalize_text(text: str) -> str:
+    return _whitespace_re.sub(" ", text).strip().lower()
+
+
+def text_hash(text: str) -> int:
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def get_shingles(text: str, shingle_size: int = 3) -> List[str]:
+    """
+    Split `text` into overlapping word shingles.
+
+    Texts shorter than `shingle_size` words are returned as a single shingle so that
+    short strings like menu items still produce a signature.
+
+    Parameters:
+        text (str): The (normalized) text to shingle.
+        shingle_size (int, default=3): Number of words per shingle.
+
+    Returns:
+        List[str]: The shingles of `text`.
+
+    Example:
+        get_shingles("read more about fish", 3) returns ["read more about", "more about fish"].
+    """
+    tokens = _token_re.findall(text)
+    if len(tokens) <= shingle_size:
+        return [" ".join(tokens)]
+    return [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+
+
+def simhash(text: str, shingle_size: int = 3, bits: int = 64) -> int:
+    """
+    Compute the SimHash fingerprint of `text`.
+
+    Texts whose fingerprints differ in only a few bits are near duplicates.
+
+    Parameters:
+        text (str): The (normalized) text to fingerprint.
+        shingle_size (int, default=3): Number of words per shingle.
+        bits (int, default=64): Fingerprint size in bits, at most 64.
+
+    Returns:
+        int: The fingerprint.
+    """
+    weights = [0] * bits
+    for shingle in get_shingles(text, shingle_size):
+        h = text_hash(shingle)
+        for i in range(bits):
+            if h >> i & 1:
+                weights[i] += 1
+            else:
+                weights[i] -= 1
+
+    fingerprint = 0
+    for i, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class MinHasher():
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self.permutations = [(rng.randint(1, _max_hash - 1), rng.randint(0, _max_hash - 1)) for _ in range(num_perm)]
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [text_hash(shingle) for shingle in get_shingles(text, self.shingle_size)]
+        return tuple(min((a * h + b) % _max_hash for h in hashes) for a, b in self.permutations)
+
+    @staticmethod
+    def jaccard(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class TextDeduplicator():
+    def __init__(self, near_dup_method: Optional[str] = "minhash", threshold: float = 0.9, shingle_size: int = 3,
+                 num_perm: int = 64, bands: int = 16, simhash_distance: int = 3, min_near_dup_len: int = 20):
+        """
+        Collapse exact and near-duplicate texts so each unique text only has to be embedded once.
+
+        Exact duplicates are found by hashing the whitespace/case normalized text. Near duplicates are
+        optionally found with either MinHash (banded LSH over word shingles) or SimHash (hamming distance
+        between 64-bit fingerprints). Every text is mapped to the first text of its duplicate group.
+
+        Parameters:
+            near_dup_method (Optional[str], default="minhash"): "minhash", "simhash" or None for exact dedup only.
+            threshold (float, default=0.9): Minimum estimated Jaccard similarity for two texts to be merged by MinHash.
+            shingle_size (int, default=3): Number of words per shingle.
+            num_perm (int, default=64): Number of MinHash permutations.
+            bands (int, default=16): Number of LSH bands, `num_perm` must be divisible by it.
+            simhash_distance (int, default=3): Maximum hamming distance for two texts to be merged by SimHash.
+            min_near_dup_len (int, default=20): Texts shorter than this (after normalization) are only deduplicated exactly,
+                                                since near-dup detection on a few words merges unrelated texts.
+        """
+        if near_dup_method not in (None, "minhash", "simhash"):
+            raise NotImplementedError(f"Near duplicate method {near_dup_method} not implemented yet.")
+        if near_dup_method == "minhash" and num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+
+        self.near_dup_method = near_dup_method
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.simhash_distance = simhash_distance
+        self.min_near_dup_len = min_near_dup_len
+        self.minhasher = MinHasher(num_perm, shingle_size) if near_dup_method == "minhash" else None
+
+    def dedup(self, texts: Iterable[str]) -> Tuple[List[str], List[int]]:
+        """
+        Deduplicate `texts`.
+
+        Parameters:
+            texts (Iterable[str]): The texts to deduplicate, e.g. the text of the nodes returned by `get_text_nodes`.
+
+        Returns:
+            Tuple[List[str], List[int]]: The unique texts, in order of first occurrence, and for every input text
+                                         the index of its representative in the unique texts.
+
+        Example:
+            dedup(["Read more", "Fish", "read  more"]) returns (["Read more", "Fish"], [0, 1, 0]).
+        """
+        unique_texts = []
+        inverse = []
+        exact_index = {}
+        near_index = None
+        if self.near_dup_method == "minhash":
+            near_index = _MinHashIndex(self)
+        elif self.near_dup_method == "simhash":
+            near_index = _SimHashIndex(self)
+
+        for text in texts:
+            normalized = normalize_text(text)
+            key = text_hash(normalized)
+            idx = exact_index.get(key)
+
+            if idx is None and near_index is not None and len(normalized) >= self.min_near_dup_len:
+                idx = near_index.query_or_add(normalized, len(unique_texts))
+
+            if idx is None:
+                idx = len(unique_texts)
+                unique_texts.append(text)
+            exact_index[key] = idx
+            inverse.append(idx)
+
+        return unique_texts, inverse
+
+    def expand(self, unique_values: List, inverse: List[int]) -> List:
+        """
+        Fan values computed for the unique texts back out to every occurrence.
+
+        Parameters:
+            unique_values (List): One value per unique text, e.g. retrieval scores.
+            inverse (List[int]): The mapping returned by `dedup`.
+
+        Returns:
+            List: One value per original text.
+        """
+        return [unique_values[idx] for idx in inverse]
+
+
+class _MinHashIndex():
+    def __init__(self, deduplicator: TextDeduplicator):
+        self.minhasher = deduplicator.minhasher
+        self.threshold = deduplicator.threshold
+        self.rows = self.minhasher.num_perm // deduplicator.bands
+        self.buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(deduplicator.bands)]
+        self.signatures: Dict[int, Tuple[int, ...]] = {}
+
+    def query_or_add(self, text: str, new_idx: int) -> Optional[int]:
+        sig = self.minhasher.signature(text)
+        band_keys = [sig[i * self.rows:(i + 1) * self.rows] for i in range(len(self.buckets))]
+
+        checked = set()
+        for bucket, band_key in zip(self.buckets, band_keys):
+            for idx in bucket.get(band_key, []):
+                if idx in checked:
+                    continue
+                checked.add(idx)
+                if MinHasher.jaccard(sig, self.signatures[idx]) >= self.threshold:
+                    return idx
+
+        self.signatures[new_idx] = sig
+        for bucket, band_key in zip(self.buckets, band_keys):
+            bucket.setdefault(band_key, []).append(new_idx)
+        return None
+
+
+class _SimHashIndex():
+    # pigeonhole: if two 64-bit fingerprints differ in at most k bits, at least one of k+1 blocks is identical
+    def __init__(self, deduplicator: TextDeduplicator):
+        self.shingle_size = deduplicator.shingle_size
+        self.max_distance = deduplicator.simhash_distance
+        num_blocks = self.max_distance + 1
+        block_size = -(-64 // num_blocks)
+        self.blocks = [(i * block_size, min(block_size, 64 - i * block_size)) for i in range(num_blocks) if i * block_size < 64]
+        self.buckets: List[Dict[int, List[int]]] = [{} for _ in self.blocks]
+        self.fingerprints: Dict[int, int] = {}
+
+    def query_or_add(self, text: str, new_idx: int) -> Optional[int]:
+        fingerprint = simhash(text, self.shingle_size)
+        block_keys = [fingerprint >> start & ((1 << size) - 1) for start, size in self.blocks]
+
+        for bucket, block_key in zip(self.buckets, block_keys):
+            for idx in bucket.get(block_key, []):
+                if hamming_distance(fingerprint, self.fingerprints[idx]) <= self.max_distance:
+                    return idx
+
+        self.fingerprints[new_idx] = fingerprint
+        for bucket, block_key in zip(self.buckets, block_keys):
+            bucket.setdefault(block_key, []).append(new_idx)
+        return None
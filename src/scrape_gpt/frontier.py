@@ -0,0 +1,494 @@
+import base64
+import hashlib
+import heapq
+import json
+import math
+import threading
+import time
+from typing import List, Tuple, Dict, Optional, Callable, Iterable, Iterator
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+from scrape_gpt.parser import SelectolaxParser
+from scrape_gpt.site_map import SiteMap, SiteMapEntry, EntryInfo, get_domain
+
+default_ports = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str, base_url: Optional[str] = None) -> Optional[str]:
+    """
+    Resolve `url` against `base_url` and normalize it so equivalent urls compare equal.
+
+    The scheme and host are lowercased, default ports and fragments are dropped, an empty path becomes "/"
+    and query parameters are sorted. Links that are not http(s), like "mailto:" or "javascript:", return None.
+
+    Parameters:
+        url (str): The url or href to normalize.
+        base_url (Optional[str], default=None): The url of the page the href was found on.
+
+    Returns:
+        Optional[str]: The normalized absolute url, or None if it can't be crawled.
+
+    Example:
+        normalize_url("../about?b=2&a=1#team", "HTTPS://Example.com:443/docs/intro") returns
+        "https://example.com/about?a=1&b=2".
+    """
+    url = url.strip()
+    if base_url:
+        url = urljoin(base_url, url)
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in default_ports or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    if port and port != default_ports[scheme]:
+        netloc = f"{netloc}:{port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def get_html(url: str, timeout: float = 10.0) -> str:
+    """
+    Fetch `url` with a plain `requests.get`.
+
+    Raises:
+        requests.RequestException: If the request failed or the response has an error status.
+        ValueError: If the response is not html.
+    """
+    response = requests.get(url, timeout=timeout)
+    check_html_response(response)
+    return response.text
+
+
+def check_html_response(response: requests.Response) -> None:
+    """
+    Raise if `response` is an error or not html.
+
+    Raises:
+        requests.RequestException: If the response has an error status.
+        ValueError: If the response is not html.
+    """
+    response.raise_for_status()
+    content_type = response.headers.get("Content-Type", "")
+    if content_type and "html" not in content_type.lower():
+        raise ValueError(f"{response.url} is not html but {content_type}")
+
+
+class BloomFilter():
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        """
+        Memory compact probabilistic set for urls. Membership checks can return false positives at roughly
+        `error_rate` once `capacity` items are added, but never false negatives.
+
+        Parameters:
+            capacity (int, default=1_000_000): Expected number of items.
+            error_rate (float, default=0.001): Target false positive rate at `capacity` items.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    def as_dict(self) -> Dict:
+        return {"capacity": self.capacity, "error_rate": self.error_rate, "count": self.count,
+                "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "BloomFilter":
+        bloom = cls(d["capacity"], d["error_rate"])
+        bloom.bits = bytearray(base64.b64decode(d["bits"]))
+        bloom.count = d["count"]
+        return bloom
+
+
+class HostState():
+    def __init__(self):
+        self.active = 0
+        self.next_allowed = 0.0
+        # queued (priority, counter, url, depth, parent_url) items of the host
+        self.queue: List[Tuple[float, int, str, int, Optional[str]]] = []
+        # True while the host is in the waiting or ready heap of the frontier
+        self.scheduled = False
+        self.ready = False
+
+
+class CrawlFrontier():
+    def __init__(self,
+                 seeds: Iterable[str] = (),
+                 max_depth: Optional[int] = None,
+                 allowed_domains: Optional[List[str]] = None,
+                 crawl_delay: float = 1.0,
+                 max_per_host: int = 1,
+                 use_bloom_filter: bool = False,
+                 bloom_capacity: int = 1_000_000,
+                 bloom_error_rate: float = 0.001,
+                 priority_func: Optional[Callable[[str, int], float]] = None):
+        """
+        Crawl frontier that turns the links found by `SelectolaxParser.get_links` into a crawl.
+
+        Discovered links are normalized, resolved against the page they were found on and deduplicated with a
+        seen-set (an exact set, or a `BloomFilter` for very large crawls). Urls are handed out by priority
+        (shallowest first by default) while respecting per-host politeness: at most `max_per_host` requests in
+        flight per host and at least `crawl_delay` seconds between requests to the same host. Every crawled url is
+        added to the `SiteMap` of its domain as a child of the entry of the page it was found on.
+
+        Every host has its own priority queue. Hosts with queued urls and a free slot sit in a heap keyed on the
+        time their crawl delay ends and move to a second heap keyed on their best queued priority once it passed,
+        so `next_url` and `wait_time` cost O(log hosts) no matter how many urls are queued.
+
+        All methods are thread safe so several fetch workers can share one frontier, e.g. by each running `crawl`
+        on its own thread.
+
+        The seen-set, the site maps and the list of crawled urls grow with the crawl and are all written by
+        `checkpoint`. A bloom filter bounds the seen-set, but for the others memory and checkpoint size stay
+        proportional to the number of crawled pages.
+
+        Parameters:
+            seeds (Iterable[str], default=()): Start urls.
+            max_depth (Optional[int], default=None): Links deeper than this many hops from a seed are not queued.
+            allowed_domains (Optional[List[str]], default=None): Registered domains that may be crawled.
+                                                                 Defaults to the domains of the seeds.
+            crawl_delay (float, default=1.0): Minimum seconds between two requests to the same host.
+            max_per_host (int, default=1): Maximum number of in-flight requests per host.
+            use_bloom_filter (bool, default=False): If True, seen urls are kept in a `BloomFilter` instead of a set.
+            bloom_capacity (int, default=1_000_000): Expected number of urls, used to size the bloom filter.
+            bloom_error_rate (float, default=0.001): False positive rate of the bloom filter.
+            priority_func (Optional[Callable[[str, int], float]], default=None): Maps (url, depth) to a priority,
+                                                                                lower is crawled first. Defaults to the depth.
+        """
+        self.max_depth = max_depth
+        self.allowed_domains = set(allowed_domains) if allowed_domains is not None else set()
+        self.restrict_to_seeds = allowed_domains is None
+        self.crawl_delay = crawl_delay
+        self.max_per_host = max_per_host
+        self.priority_func = priority_func or (lambda url, depth: depth)
+
+        if use_bloom_filter:
+            self.seen = BloomFilter(bloom_capacity, bloom_error_rate)
+        else:
+            self.seen = set()
+
+        self.counter = 0
+        self.num_queued = 0
+        self.hosts: Dict[str, HostState] = {}
+        # (next_allowed, host) of hosts with queued urls and a free slot that are still in their crawl delay
+        self.waiting: List[Tuple[float, str]] = []
+        # (priority, counter, host) of the best queued url of hosts that may be crawled now. Entries whose
+        # host got a better url or was crawled in the meantime are stale and skipped
+        self.ready: List[Tuple[float, int, str]] = []
+        self.in_flight: Dict[str, Tuple[float, int, str, int, Optional[str]]] = {}
+        self.site_maps: Dict[str, SiteMap] = {}
+        self.entries: Dict[str, SiteMapEntry] = {}
+        # (url, parent_url) of every crawled page, enough to rebuild the site maps on resume
+        self.crawled: List[Tuple[str, Optional[str]]] = []
+        self.lock = threading.Lock()
+
+        for seed in seeds:
+            self.add_seed(seed)
+
+    def __len__(self):
+        return self.num_queued
+
+    def __str__(self):
+        return f"CrawlFrontier with {self.num_queued} queued and {len(self.crawled)} crawled urls"
+
+    def __repr__(self):
+        return f"CrawlFrontier({self.num_queued})"
+
+    def add_seed(self, url: str) -> bool:
+        if self.restrict_to_seeds:
+            normalized = normalize_url(url)
+            if normalized is not None:
+                self.allowed_domains.add(get_domain(normalized))
+        return self.add_url(url, depth=0)
+
+    def add_url(self, url: str, depth: int = 0, base_url: Optional[str] = None, parent_url: Optional[str] = None) -> bool:
+        """
+        Queue `url` if it is crawlable and hasn't been seen yet.
+
+        Parameters:
+            url (str): The url or href to queue.
+            depth (int, default=0): Number of hops from a seed.
+            base_url (Optional[str], default=None): The url `url` is resolved against.
+            parent_url (Optional[str], default=None): The crawled page the link was found on.
+
+        Returns:
+            bool: True if the url was queued.
+        """
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        url = self._filter_url(url, base_url)
+        if url is None:
+            return False
+        with self.lock:
+            return self._queue_url(url, depth, parent_url)
+
+    def _filter_url(self, url: str, base_url: Optional[str] = None) -> Optional[str]:
+        url = normalize_url(url, base_url)
+        if url is None:
+            return None
+        if self.allowed_domains and get_domain(url) not in self.allowed_domains:
+            return None
+        return url
+
+    def _queue_url(self, url: str, depth: int, parent_url: Optional[str]) -> bool:
+        # the lock has to be held
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        self._push((self.priority_func(url, depth), self.counter, url, depth, parent_url))
+        self.counter += 1
+        return True
+
+    def _push(self, item: Tuple[float, int, str, int, Optional[str]]) -> None:
+        host = urlsplit(item[2]).netloc
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState()
+        heapq.heappush(state.queue, item)
+        self.num_queued += 1
+        if state.ready and state.queue[0] is item:
+            # the new url beats the one the host is ready with, the old entry goes stale
+            heapq.heappush(self.ready, (item[0], item[1], host))
+        else:
+            self._schedule(host, state)
+
+    def _schedule(self, host: str, state: HostState) -> None:
+        if state.scheduled or not state.queue or state.active >= self.max_per_host:
+            return
+        state.scheduled = True
+        heapq.heappush(self.waiting, (state.next_allowed, host))
+
+    def add_links(self, page_url: str, links: Iterable[str], depth: int) -> int:
+        return sum(self.add_url(link, depth + 1, base_url=page_url, parent_url=page_url) for link in links)
+
+    def add_page(self, page_url: str, parser: SelectolaxParser, depth: int) -> int:
+        """
+        Queue every link of a crawled page.
+
+        Parameters:
+            page_url (str): The url the page was fetched from, used to resolve relative links.
+            parser (SelectolaxParser): The parsed page.
+            depth (int): The depth of the page.
+
+        Returns:
+            int: The number of newly queued urls.
+        """
+        _, links = parser.get_links(parser.tree.root)
+        return self.add_links(page_url, links, depth)
+
+    def next_url(self) -> Optional[Tuple[str, int]]:
+        """
+        Take the highest priority url whose host has a free slot and whose crawl delay has passed.
+
+        The caller must call `done` with the url once it was fetched.
+
+        Returns:
+            Optional[Tuple[str, int]]: The url and its depth, or None if no url is ready right now.
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.waiting and self.waiting[0][0] <= now:
+                _, host = heapq.heappop(self.waiting)
+                state = self.hosts[host]
+                state.ready = True
+                heapq.heappush(self.ready, (state.queue[0][0], state.queue[0][1], host))
+
+            while self.ready:
+                priority, counter, host = heapq.heappop(self.ready)
+                state = self.hosts[host]
+                if not state.ready or state.queue[0][:2] != (priority, counter):
+                    continue
+
+                item = heapq.heappop(state.queue)
+                self.num_queued -= 1
+                state.scheduled = False
+                state.ready = False
+                state.active += 1
+                state.next_allowed = now + self.crawl_delay
+                self._schedule(host, state)
+                self.in_flight[item[2]] = item
+                return item[2], item[3]
+            return None
+
+    def wait_time(self) -> Optional[float]:
+        """
+        Seconds until some queued url may become ready, or None once the crawl is finished: nothing is queued
+        and no url is in flight that could still add links.
+        """
+        with self.lock:
+            if not self.num_queued:
+                # pages in flight may still add links, workers have to wait for their `done` calls
+                return max(self.crawl_delay, 0.05) if self.in_flight else None
+            if self.ready:
+                return 0.0
+            if self.waiting:
+                return max(0.0, self.waiting[0][0] - time.monotonic())
+            # every host is busy, the caller has to wait for a `done` call
+            return max(self.crawl_delay, 0.05)
+
+    def done(self, url: str, success: bool = True, links: Iterable[str] = ()) -> Optional[SiteMapEntry]:
+        """
+        Release the host slot of `url` and, on success, add it to the site map of its domain and queue its links.
+
+        The links are queued together with the release, so other workers never see the crawl as finished while
+        the page's links are still on their way in.
+
+        Parameters:
+            url (str): A url returned by `next_url`.
+            success (bool, default=True): False if the fetch failed. Failed urls are not added to the site map.
+            links (Iterable[str], default=()): The links found on the page, resolved against `url`.
+
+        Returns:
+            Optional[SiteMapEntry]: The site map entry created for the url.
+        """
+        # normalizing is the slow part, so it happens before taking the lock
+        links = [link for link in (self._filter_url(link, url) for link in links) if link is not None] if success else []
+        with self.lock:
+            host = urlsplit(url).netloc
+            state = self.hosts[host]
+            state.active -= 1
+            self._schedule(host, state)
+            _, _, _, depth, parent_url = self.in_flight.pop(url)
+            if not success:
+                return None
+            self.crawled.append((url, parent_url))
+            entry = self._add_entry(url, parent_url)
+            if self.max_depth is None or depth + 1 <= self.max_depth:
+                for link in links:
+                    self._queue_url(link, depth + 1, url)
+            return entry
+
+    def _add_entry(self, url: str, parent_url: Optional[str]) -> SiteMapEntry:
+        domain = get_domain(url)
+        site_map = self.site_maps.get(domain)
+        if site_map is None:
+            site_map = SiteMap(url)
+            self.site_maps[domain] = site_map
+
+        info = EntryInfo(urlsplit(url).path, url, "link")
+        parent_entry = self.entries.get(parent_url) if parent_url else None
+        if parent_entry is not None and get_domain(parent_url) == domain:
+            entry = parent_entry.create_child(info)
+        else:
+            entry = site_map.create_entry(entry_info=info)
+        self.entries[url] = entry
+        return entry
+
+    def crawl(self, fetch_html: Optional[Callable[[str], str]] = None, max_pages: Optional[int] = None,
+              timeout: float = 10.0) -> Iterator[Tuple[str, int, SelectolaxParser]]:
+        """
+        Crawl sequentially until the frontier is exhausted or `max_pages` pages were crawled.
+
+        A page whose fetch raises a `requests.RequestException` or a `ValueError` is skipped. Any other exception
+        is raised after the url was released, so its host isn't blocked if the crawl is continued.
+
+        Parameters:
+            fetch_html (Optional[Callable[[str], str]], default=None): Fetches a url. Defaults to `get_html`.
+            max_pages (Optional[int], default=None): Stop after this many pages.
+            timeout (float, default=10.0): Request timeout in seconds used by `get_html`.
+
+        Yields:
+            Tuple[str, int, SelectolaxParser]: The url, depth and parsed page of every crawled page.
+        """
+        if fetch_html is None:
+            fetch_html = lambda url: get_html(url, timeout)
+
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            item = self.next_url()
+            if item is None:
+                wait = self.wait_time()
+                if wait is None:
+                    return
+                time.sleep(wait)
+                continue
+
+            url, depth = item
+            parser = None
+            links = None
+            try:
+                parser = SelectolaxParser(fetch_html(url))
+                _, links = parser.get_links(parser.tree.root)
+            except (requests.RequestException, ValueError):
+                pass
+            finally:
+                self.done(url, success=links is not None, links=links or ())
+            if links is None:
+                continue
+            pages += 1
+            yield url, depth, parser
+
+    def checkpoint(self, path: str) -> None:
+        """
+        Write the frontier state to a json file at `path`. In-flight urls are saved as queued.
+        """
+        with self.lock:
+            queue = [item for state in self.hosts.values() for item in state.queue] + list(self.in_flight.values())
+            seen = self.seen.as_dict() if isinstance(self.seen, BloomFilter) else sorted(self.seen)
+            state = {
+                "max_depth": self.max_depth,
+                "allowed_domains": sorted(self.allowed_domains),
+                "restrict_to_seeds": self.restrict_to_seeds,
+                "crawl_delay": self.crawl_delay,
+                "max_per_host": self.max_per_host,
+                "queue": queue,
+                "counter": self.counter,
+                "seen": seen,
+                "crawled": self.crawled,
+            }
+        with open(path, "w") as f:
+            json.dump(state, f)
+
+    @classmethod
+    def resume(cls, path: str, priority_func: Optional[Callable[[str, int], float]] = None) -> "CrawlFrontier":
+        """
+        Rebuild a frontier, including its site maps, from a file written by `checkpoint`.
+        """
+        with open(path) as f:
+            state = json.load(f)
+
+        frontier = cls(max_depth=state["max_depth"], allowed_domains=state["allowed_domains"],
+                       crawl_delay=state["crawl_delay"], max_per_host=state["max_per_host"], priority_func=priority_func)
+        frontier.restrict_to_seeds = state["restrict_to_seeds"]
+        if isinstance(state["seen"], dict):
+            frontier.seen = BloomFilter.from_dict(state["seen"])
+        else:
+            frontier.seen = set(state["seen"])
+        for item in state["queue"]:
+            frontier._push(tuple(item))
+        frontier.counter = state["counter"]
+        for url, parent_url in state["crawled"]:
+            frontier.crawled.append((url, parent_url))
+            frontier._add_entry(url, parent_url)
+        return frontier
@@ -0,0 +1,94 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple, Dict, Optional, Any, Callable
+
+from selectolax.parser import Node
+
+from scrape_gpt.parser import SelectolaxParser
+from scrape_gpt.site_map import DictIterableMixin
+
+
+@dataclass
+class PageSnapshot(DictIterableMixin):
+    url: str
+    subtree_hashes: Dict[str, Tuple[str, int, bool]]
+    section_results: Dict[str, Any] = field(default_factory=dict)
+    # extra state the results depend on, e.g. the retrieval queries. Results are reused only if it matches
+    result_key: Any = None
+
+    def __str__(self):
+        return f"PageSnapshot for {self.url} with {len(self.section_results)} sections"
+
+    def __repr__(self):
+        return f"PageSnapshot({self.url})"
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "PageSnapshot":
+        # json/yaml round trips turn the hash tuples into lists
+        subtree_hashes = {path: tuple(value) for path, value in d["subtree_hashes"].items()}
+        return cls(d["url"], subtree_hashes, d.get("section_results", {}), d.get("result_key"))
+
+
+def refresh_sections(parser: SelectolaxParser,
+                     url: str,
+                     extract_sections: Callable[[Dict[str, Node]], Dict[str, Any]],
+                     snapshot: Optional[PageSnapshot] = None,
+                     result_key: Any = None,
+                     max_section_len: int = 2000) -> Tuple[PageSnapshot, List[str]]:
+    """
+    Extract a page section by section, reusing the results of sections that did not change since `snapshot`.
+
+    The page is hashed with `get_subtree_hashes` and split with `get_sections`. A section whose subtree hash matches
+    a section of the previous visit keeps its stored result, even if an inserted or removed sibling moved it to
+    another path. Every other section is passed to `extract_sections` in a single call, so the extraction cost scales
+    with the amount of changed content and not with the page size.
+
+    Parameters:
+        parser (SelectolaxParser): The parsed page.
+        url (str): The page url.
+        extract_sections (Callable[[Dict[str, Node]], Dict[str, Any]]): Called with the changed section nodes keyed by
+                                                                        path, returns one result per path.
+        snapshot (Optional[PageSnapshot], default=None): The snapshot from the previous visit. None extracts everything.
+        result_key (Any, default=None): Stored with the results. If it differs from the snapshot's, nothing is reused.
+        max_section_len (int, default=2000): Passed to `get_sections`.
+
+    Returns:
+        Tuple[PageSnapshot, List[str]]: The snapshot for this visit and the paths of the re-extracted sections.
+
+    Example:
+        If only a price changed since the last visit, only the section holding the price is passed to
+        `extract_sections` and the returned list holds just its path.
+    """
+    hashes, nodes = parser.get_subtree_hashes()
+    sections = parser.get_sections(hashes, max_section_len)
+
+    reusable = snapshot is not None and snapshot.result_key == result_key
+    # results by subtree hash, so a section still matches after an inserted element shifted its sibling indices
+    results_by_hash = {}
+    if reusable:
+        for path, result in snapshot.section_results.items():
+            old = snapshot.subtree_hashes.get(path)
+            if old is not None:
+                results_by_hash.setdefault(old[0], result)
+
+    section_results = {}
+    changed_nodes = {}
+    for path in sections:
+        subtree_hash = hashes[path][0]
+        if reusable and path in snapshot.section_results:
+            old = snapshot.subtree_hashes.get(path)
+            if old is not None and old[0] == subtree_hash:
+                section_results[path] = snapshot.section_results[path]
+                continue
+        if subtree_hash in results_by_hash:
+            section_results[path] = results_by_hash[subtree_hash]
+        else:
+            changed_nodes[path] = nodes[path]
+
+    if changed_nodes:
+        new_results = extract_sections(changed_nodes)
+        for path in changed_nodes:
+            section_results[path] = new_results[path]
+
+    # keep document order so merged results line up with the page
+    section_results = {path: section_results[path] for path in sections}
+    return PageSnapshot(url, hashes, section_results, result_key), list(changed_nodes)
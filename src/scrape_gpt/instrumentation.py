@@ -0,0 +1,172 @@
+import functools
+import inspect
+import threading
+import time
+from typing import List, Dict, Optional, Any, Callable
+
+# called with (stage, elapsed seconds, counters) after every recorded call
+Hook = Callable[[str, float, Dict[str, int]], None]
+
+
+class StageStats():
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.max_time = 0.0
+        self.counters: Dict[str, int] = {}
+
+    def __str__(self):
+        return f"{self.calls} calls, {self.wall_time:.4f}s"
+
+    def __repr__(self):
+        return f"StageStats({self.calls}, {self.wall_time:.4f})"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "wall_time": self.wall_time, "max_time": self.max_time, **self.counters}
+
+
+class Stats():
+    def __init__(self, enabled: bool = False):
+        """
+        Per-stage timings and counters for the scraper, parser and site map.
+
+        Instrumented code asks `start()` for a start time and passes it to `record` with its counters
+        (bytes fetched, nodes visited, tokens processed, batch sizes, ...). While disabled, `start()` returns None
+        and instrumented code skips the rest, so the cost is a single attribute check per call.
+
+        Parameters:
+            enabled (bool, default=False): Start recording right away.
+
+        Example:
+            from scrape_gpt.instrumentation import stats
+            stats.enable()
+            scraper = LlmScraper(url)
+            scraper.text_retrieval(queries, corpus)
+            print(stats.as_dict()["scraper.forward"])
+        """
+        self.enabled = enabled
+        self.stages: Dict[str, StageStats] = {}
+        self.hooks: List[Hook] = []
+        self.lock = threading.Lock()
+        # set while an instrumented function runs on the thread, so functions it calls aren't recorded again
+        self._local = threading.local()
+
+    def __str__(self):
+        lines = [f"{name}: {stage}" for name, stage in sorted(self.stages.items(), key=lambda item: -item[1].wall_time)]
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"Stats({len(self.stages)} stages)"
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages = {}
+
+    def add_hook(self, hook: Hook) -> None:
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Hook) -> None:
+        self.hooks.remove(hook)
+
+    def start(self) -> Optional[float]:
+        return time.perf_counter() if self.enabled else None
+
+    def record(self, stage: str, start: Optional[float], **counters: int) -> None:
+        """
+        Record one call of `stage` that started at `start`, as returned by `start()`.
+
+        Parameters:
+            stage (str): The stage name, e.g. "scraper.fetch_html".
+            start (Optional[float]): The start time. None records nothing, so callers can pass the result of `start()` straight through.
+            **counters (int): Amounts added to the stage's counters, e.g. bytes=1024.
+        """
+        if start is None:
+            return
+        self._add(stage, time.perf_counter() - start, counters)
+
+    def _add(self, stage: str, elapsed: float, counters: Dict[str, int]) -> None:
+        with self.lock:
+            stage_stats = self.stages.get(stage)
+            if stage_stats is None:
+                stage_stats = self.stages[stage] = StageStats()
+            stage_stats.calls += 1
+            stage_stats.wall_time += elapsed
+            stage_stats.max_time = max(stage_stats.max_time, elapsed)
+            for name, value in counters.items():
+                stage_stats.counters[name] = stage_stats.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook(stage, elapsed, counters)
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {name: stage.as_dict() for name, stage in self.stages.items()}
+
+    def instrument(self, stage: str, counters: Optional[Callable[[Any], Dict[str, int]]] = None) -> Callable:
+        """
+        Decorator recording every call of the decorated function as `stage`.
+
+        Only the outermost instrumented call on a thread is recorded, instrumented functions it calls run untimed,
+        so nested stages like `get_links` calling `conditional_traverse` aren't counted twice. Explicit `record`
+        calls inside an instrumented function still record, they break its time down further.
+
+        For generator functions only the time spent producing the items is recorded, not the time the consumer
+        spends between them, and the number of yielded items is counted as "nodes". Otherwise `counters`, if
+        given, computes the counters from the return value.
+        """
+        def decorator(func: Callable) -> Callable:
+            if inspect.isgeneratorfunction(func):
+                def instrumented_generator(gen):
+                    elapsed = 0.0
+                    nodes = 0
+                    outermost = False
+                    try:
+                        while True:
+                            # a step run from inside another instrumented call is part of that call's time
+                            nested = getattr(self._local, "active", False)
+                            self._local.active = True
+                            start = time.perf_counter()
+                            try:
+                                item = next(gen)
+                            except StopIteration:
+                                return
+                            finally:
+                                if not nested:
+                                    elapsed += time.perf_counter() - start
+                                    outermost = True
+                                    self._local.active = False
+                            nodes += 1
+                            yield item
+                    finally:
+                        gen.close()
+                        if outermost:
+                            self._add(stage, elapsed, {"nodes": nodes})
+
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    if not self.enabled or getattr(self._local, "active", False):
+                        return func(*args, **kwargs)
+                    return instrumented_generator(func(*args, **kwargs))
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    if not self.enabled or getattr(self._local, "active", False):
+                        return func(*args, **kwargs)
+                    start = self.start()
+                    self._local.active = True
+                    try:
+                        result = func(*args, **kwargs)
+                    finally:
+                        self._local.active = False
+                    self.record(stage, start, **(counters(result) if counters else {}))
+                    return result
+            return wrapper
+        return decorator
+
+
+stats = Stats()
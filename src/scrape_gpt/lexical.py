@@ -0,0 +1,92 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import List, Tuple, Dict, Optional
+
+_token_re = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _token_re.findall(text.lower())
+
+
+class BM25Index():
+    def __init__(self, corpus: List[str], k1: float = 1.5, b: float = 0.75):
+        """
+        In-memory inverted index with BM25 scoring, used as a cheap lexical prefilter before dense retrieval.
+
+        Parameters:
+            corpus (List[str]): The texts to index.
+            k1 (float, default=1.5): Term frequency saturation.
+            b (float, default=0.75): Document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(corpus)
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+
+        for doc_id, text in enumerate(corpus):
+            tokens = tokenize(text)
+            self.doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+
+        self.avg_doc_len = sum(self.doc_lens) / self.num_docs if self.num_docs else 0.0
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str) -> Dict[int, float]:
+        """
+        Score every document sharing at least one term with `query`.
+
+        Parameters:
+            query (str): The query.
+
+        Returns:
+            Dict[int, float]: BM25 score per matching document index. Documents without a matching term are left out.
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_id] / (self.avg_doc_len or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def top_n(self, query: str, n: int) -> List[int]:
+        scores = self.score(query)
+        return [doc_id for doc_id, _ in heapq.nlargest(n, scores.items(), key=lambda item: item[1])]
+
+    def get_candidates(self, queries: List[str], n: int, min_candidates: int = 0) -> Optional[List[int]]:
+        """
+        Select the dense retrieval candidates for `queries`: the union of every query's top `n` documents.
+
+        Parameters:
+            queries (List[str]): The queries.
+            n (int): Number of candidates per query.
+            min_candidates (int, default=0): Fall through if fewer candidates than this are found, e.g. the top_k of the dense stage.
+
+        Returns:
+            Optional[List[int]]: Sorted candidate document indices, or None if some query has no lexical match or there are
+                                 too few candidates, in which case the whole corpus should be scored densely.
+
+        Example:
+            With the corpus ["fish are cool", "cats", "about fish"] and the query "fish", get_candidates(["fish"], 2)
+            returns [0, 2]. For the query "dog" it returns None.
+        """
+        candidates = set()
+        for query in queries:
+            query_candidates = self.top_n(query, n)
+            if not query_candidates:
+                return None
+            candidates.update(query_candidates)
+        if len(candidates) < min_candidates:
+            return None
+        return sorted(candidates)
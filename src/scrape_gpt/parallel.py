@@ -0,0 +1,157 @@
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Any, Callable, Iterable, Iterator
+
+import torch
+from transformers import BertTokenizerFast, BertModel
+
+_done_item = object()
+
+
+def prefetch_map(func: Callable[[Any], Any], items: Iterable[Any], prefetch: int = 2) -> Iterator[Any]:
+    """
+    Lazily map `func` over `items` on a background thread, staying up to `prefetch` results ahead of the consumer.
+
+    Used to tokenize the next batches while the current one runs through the model. Fast tokenizers and torch ops
+    release the GIL, so both really run at the same time.
+
+    Parameters:
+        func (Callable[[Any], Any]): Applied to every item on the background thread.
+        items (Iterable[Any]): The inputs.
+        prefetch (int, default=2): Maximum number of results computed ahead.
+
+    Yields:
+        Any: `func(item)` for every item, in order. An exception raised by `func` is re-raised here.
+    """
+    results = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                result = func(item)
+                while not stop.is_set():
+                    try:
+                        results.put((result, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            results.put((_done_item, None))
+        except BaseException as e:
+            results.put((_done_item, e))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            result, error = results.get()
+            if error is not None:
+                raise error
+            if result is _done_item:
+                break
+            yield result
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full queue
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+
+_worker_scraper = None
+
+
+def _init_worker(model: BertModel, tokenizer: BertTokenizerFast, batch_size: Optional[int], prefetch_batches: int,
+                 core_queue: "multiprocessing.Queue") -> None:
+    global _worker_scraper
+    # imported here, scraper imports this module
+    from scrape_gpt.scraper import LlmScraper
+
+    cores = core_queue.get()
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    if cores:
+        torch.set_num_threads(len(cores))
+
+    _worker_scraper = LlmScraper(load_retrieval_model=False, model=model, tokenizer=tokenizer,
+                                 batch_size=batch_size, prefetch_batches=prefetch_batches)
+
+
+def _encode_shard(texts: List[str]) -> torch.Tensor:
+    return _worker_scraper.embed_texts(texts)
+
+
+class ShardedEncoder():
+    def __init__(self, model: BertModel, tokenizer: BertTokenizerFast, num_workers: int = 2,
+                 cores: Optional[List[int]] = None, batch_size: Optional[int] = 32, prefetch_batches: int = 2,
+                 min_shard_size: int = 256):
+        """
+        Encode very large corpora by sharding them across worker processes, each pinned to its own subset of cores.
+
+        Every worker holds a copy of the model, so memory grows with `num_workers`. Inside a worker texts are
+        batched and tokenization overlaps with the forward passes just like in `LlmScraper.embed_texts`.
+        Use it as a context manager, or call `close`, to shut the workers down.
+
+        Parameters:
+            model (BertModel): The retrieval model, on the CPU. It is copied into every worker once.
+            tokenizer (BertTokenizerFast): The tokenizer.
+            num_workers (int, default=2): Number of worker processes.
+            cores (Optional[List[int]], default=None): Cores to split between the workers. Defaults to every core this
+                                                       process may run on.
+            batch_size (Optional[int], default=32): Texts per forward pass inside a worker.
+            prefetch_batches (int, default=2): Batches tokenized ahead inside a worker.
+            min_shard_size (int, default=256): Corpora are split into at most one shard per this many texts, so small
+                                               inputs don't pay the inter-process overhead for nothing.
+
+        Example:
+            with ShardedEncoder(scraper.model, scraper.tokenizer, num_workers=4) as encoder:
+                results = scraper.text_retrieval(queries, corpus, encoder=encoder)
+        """
+        if any(param.device.type != "cpu" for param in model.parameters()):
+            raise ValueError("ShardedEncoder workers run on the CPU, the model has to be on the CPU.")
+
+        if cores is None:
+            cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.num_workers = num_workers
+        self.min_shard_size = min_shard_size
+
+        context = multiprocessing.get_context("spawn")
+        core_queue = context.Queue()
+        per_worker = max(1, len(cores) // num_workers)
+        for i in range(num_workers):
+            core_queue.put(cores[i * per_worker:(i + 1) * per_worker] or cores[-per_worker:])
+
+        self.executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_init_worker,
+                                            initargs=(model, tokenizer, batch_size, prefetch_batches, core_queue))
+
+    def __enter__(self) -> "ShardedEncoder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def encode(self, texts: List[str]) -> torch.Tensor:
+        """
+        Embed `texts` across the workers.
+
+        Parameters:
+            texts (List[str]): The texts, already formatted for retrieval.
+
+        Returns:
+            torch.Tensor: The normalized embeddings, in the order of `texts`.
+        """
+        num_shards = min(self.num_workers, max(1, len(texts) // self.min_shard_size))
+        shard_size = -(-len(texts) // num_shards) if texts else 1
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        return torch.cat(list(self.executor.map(_encode_shard, shards)))
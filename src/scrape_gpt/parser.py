@@ -1,22 +1,31 @@
+import hashlib
 import requests
 from selectolax.parser import HTMLParser, Node
 from typing import List, Tuple, Dict, Union, Optional, Generator, Iterator
+from scrape_gpt.instrumentation import stats
 
 header_tags = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
 
 class SelectolaxParser():
-    def __init__(self, html):
+    def __init__(self, html, clean: bool = True):
+        start = stats.start()
         self.tree = HTMLParser(html)
-        self.remove_unwanted_nodes()
+        stats.record("parser.parse", start, bytes=len(html))
+        # clean=False keeps scripts, styles, comments and whitespace-only text, e.g. to call remove_unwanted_nodes later
+        if clean:
+            self.remove_unwanted_nodes()
         
     
     
     def remove_unwanted_nodes(self):
+        start = stats.start()
         tags = ["script", "style"]
         self.tree.strip_tags(tags, recursive=True)
 
         nodes_to_remove = []
+        nodes_visited = 0
         for node in self.tree.root.traverse(include_text=True):
+            nodes_visited += 1
             tag = node.tag
             if tag == '-text' and not node.text_content.strip():
                 nodes_to_remove.append(node)
@@ -26,11 +35,13 @@ class SelectolaxParser():
         
         for node in nodes_to_remove:
             node.decompose(recursive=False)
+        stats.record("parser.remove_unwanted_nodes", start, nodes=nodes_visited, removed=len(nodes_to_remove))
     
 
 
     
 
+    @stats.instrument("parser.conditional_traverse")
     def conditional_traverse(self, start_node: Node, end_node: Optional[Node] = None, include_text: bool = True,
                              include_self: bool = True, ignore_nodes: List[Node] = [], 
                              children_only: bool = False, tags: List[str] = [], match_excluded_tags: bool = True) -> Iterator[Node]:
@@ -113,6 +124,7 @@ class SelectolaxParser():
                 yield node
     
 
+    @stats.instrument("parser.traverse_text_nodes")
     def traverse_text_nodes(self, start_node: Node, end_node: Optional[Node] = None, include_self: bool = True, ignore_nodes: List[Node] = [], children_only: bool = False) -> Iterator[Node]:
         """
         Traverse through text nodes starting from `start_node` based on the provided conditions.
@@ -141,8 +153,8 @@ class SelectolaxParser():
                                              end_node=end_node, 
                                              include_text=True, 
                                              include_self=include_self, 
-                                             tag_conditions=tag_conditions, 
-                                             ignore_tags=[], 
+                                             tags=tag_conditions, 
+                                             match_excluded_tags=False, 
                                              ignore_nodes=ignore_nodes,
                                              children_only=children_only)
 
@@ -159,6 +171,7 @@ class SelectolaxParser():
             node = parent
         return False
 
+    @stats.instrument("parser.traverse_media_nodes")
     def traverse_media_nodes(self, start_node: Node, end_node: Optional[Node] = None, include_self: bool = True, 
                             ignore_nodes: List[Node] = [], extract_text_within_headers: bool = False, children_only: bool = False) -> Iterator[Node]:
         """
@@ -199,8 +212,8 @@ class SelectolaxParser():
                                             filter_func,
                                             end_node=end_node, 
                                             include_self=include_self, 
-                                            tag_conditions=tag_conditions, 
-                                            ignore_tags=[], 
+                                            tags=tag_conditions, 
+                                            match_excluded_tags=False, 
                                             ignore_nodes=ignore_nodes,
                                             children_only=children_only)
 
@@ -209,6 +222,7 @@ class SelectolaxParser():
 
     
 
+    @stats.instrument("parser.get_headings", lambda result: {"nodes": len(result[0])})
     def get_headings(self, start_node: Node, end_node: Optional[Node] = None, include_self: bool = True, children_only: bool = False) -> Tuple[List[Node], List[str]]:
 
         """
@@ -235,7 +249,7 @@ class SelectolaxParser():
         heading_text = []
         gen = self.conditional_traverse(start_node,end_node, include_text=False, include_self=include_self, tags=header_tags, 
                                         match_excluded_tags=False, children_only=children_only)
-        for node in gen(include_text=True):
+        for node in gen:
             text = node.text().strip()
             heading_text.append(text)
             heading_nodes.append(node)
@@ -256,18 +270,21 @@ class SelectolaxParser():
         ignore_fragments (bool, default=True): If True, fragment links are excluded.
 
         Returns:
-        Optional[str]: The extracted link or None if the link is a fragment and ignore_fragments is True.
+        Optional[str]: The extracted link, or None if the node has no "href" or the link is a fragment and ignore_fragments is True.
 
         Example:
         If the node represents the HTML <a href="#section2">Section 2</a> and ignore_fragments
         is True, this method will return None. However, if ignore_fragments is False, it will return '#section2'.
         """
 
-        link = node.attributes["href"]
+        link = node.attributes.get("href")
+        if link is None:
+            return None
         if ignore_fragments and link.startswith('#'):
             return None
         return link
 
+    @stats.instrument("parser.get_links", lambda result: {"nodes": len(result[0])})
     def get_links(self, start_node: Node, end_node: Optional[Node] = None, include_self: bool = True, ignore_fragments: bool = True, children_only: bool = False) -> Tuple[List[Node], List[str]]:
         """
         Extracts and returns link nodes and their corresponding "href" attributes starting from start_node.
@@ -294,14 +311,15 @@ class SelectolaxParser():
         """
         link_nodes = []
         links = []
-        gen = self.conditional_traverse(start_node, include_text=False, include_self=include_self, tags=["a"], match_excluded_tags=False, children_only=children_only)
-        for node in gen(start_node, end_node=end_node, include_text=False, include_self=include_self):
+        gen = self.conditional_traverse(start_node, end_node=end_node, include_text=False, include_self=include_self, tags=["a"], match_excluded_tags=False, children_only=children_only)
+        for node in gen:
             link = self.extract_link(node, ignore_fragments=ignore_fragments)
             if link is not None:
                 links.append(link)
                 link_nodes.append(node)
         return link_nodes, links
     
+    @stats.instrument("parser.get_media_paths", lambda result: {"texts": len(result[0]), "images": len(result[1])})
     def get_media_paths(self, node: Node, path: str = "", return_text: bool = True, return_images: bool = True) -> Tuple[List[Tuple[str, int]], List[Tuple[str, str]]]: # should I return a dict instead?
         # think i should rewrite this if it proves useful to inlcude params like ignore_nodes, tags, etc.
         """
@@ -332,7 +350,9 @@ class SelectolaxParser():
             ('div.img', 'Sample Image Description')
         ])
         """
+        return self._get_media_paths(node, path, return_text, return_images)
 
+    def _get_media_paths(self, node: Node, path: str, return_text: bool, return_images: bool) -> Tuple[List[Tuple[str, int]], List[Tuple[str, str]]]:
         texts = []
         images = []
         for child in node.iter(include_text=True):
@@ -352,13 +372,131 @@ class SelectolaxParser():
                     
                     images.append((new_path, text))
 
-            new_results, imgs = self.get_media_paths(child, new_path, return_text, return_images)
+            new_results, imgs = self._get_media_paths(child, new_path, return_text, return_images)
             if new_results:
                 texts.extend(new_results)
             if imgs:
                 images.extend(imgs)
         return texts, images
-    
+
+
+    def _hash_subtree(self, node: Node, path: str, hashes: Dict[str, Tuple[str, int, bool]], nodes: Dict[str, Node],
+                      attributes: Optional[List[str]]) -> Tuple[str, int]:
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(node.tag.encode("utf-8"))
+        for key, value in sorted(node.attributes.items()):
+            if attributes is not None and key not in attributes:
+                continue
+            hasher.update(f"\x00{key}={value}".encode("utf-8"))
+
+        # reserve the slot so the dicts stay in document order
+        hashes[path] = None
+        nodes[path] = node
+
+        text_len = 0
+        has_direct_text = False
+        has_element_children = False
+        tag_counts = {}
+        for child in node.iter(include_text=True):
+            tag = child.tag
+            if tag == "-text":
+                text = child.text_content.strip()
+                hasher.update(f"\x01{text}".encode("utf-8"))
+                text_len += len(text)
+                has_direct_text = has_direct_text or bool(text)
+                continue
+
+            has_element_children = True
+            index = tag_counts.get(tag, 0)
+            tag_counts[tag] = index + 1
+            child_hash, child_len = self._hash_subtree(child, f"{path}.{tag}[{index}]", hashes, nodes, attributes)
+            hasher.update(f"\x02{child_hash}".encode("utf-8"))
+            text_len += child_len
+
+        subtree_hash = hasher.hexdigest()
+        hashes[path] = (subtree_hash, text_len, has_element_children and not has_direct_text)
+        return subtree_hash, text_len
+
+    @stats.instrument("parser.get_subtree_hashes", lambda result: {"nodes": len(result[0])})
+    def get_subtree_hashes(self, start_node: Optional[Node] = None, attributes: Optional[List[str]] = None) -> Tuple[Dict[str, Tuple[str, int, bool]], Dict[str, Node]]:
+        """
+        Compute a Merkle-style content hash for every element subtree starting from `start_node`.
+
+        Each element's hash covers its tag, its attributes, its direct text and the hashes of its child
+        elements, so two subtrees have the same hash exactly when their content is the same. Elements are keyed
+        by an indexed tag path (e.g. "html[0].body[0].div[2]") which stays stable between visits of the same page
+        as long as the structure above the element doesn't change.
+
+        Parameters:
+            start_node (Optional[Node], default=None): The root of the hashed subtree. Defaults to the tree root.
+            attributes (Optional[List[str]], default=None): Names of the attributes covered by the hash. None covers all of them.
+
+        Returns:
+            Tuple[Dict[str, Tuple[str, int, bool]], Dict[str, Node]]:
+                The first dict maps each path to (subtree hash, subtree text length, splittable), where splittable
+                is True if all of the element's text lives in child elements. The second dict maps each path to its node.
+                Both dicts are in document order.
+
+        Example:
+            For <html><body><div>fish</div><div>cats</div></body></html> the paths are "html[0]", "html[0].body[0]",
+            "html[0].body[0].div[0]" and "html[0].body[0].div[1]". Changing "cats" to "dogs" changes the hashes of
+            "html[0]", "html[0].body[0]" and "html[0].body[0].div[1]" only.
+        """
+        if start_node is None:
+            start_node = self.tree.root
+        hashes = {}
+        nodes = {}
+        self._hash_subtree(start_node, f"{start_node.tag}[0]", hashes, nodes, attributes)
+        return hashes, nodes
+
+    def diff_subtree_hashes(self, old_hashes: Dict[str, Tuple[str, int, bool]], new_hashes: Dict[str, Tuple[str, int, bool]]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compare two results of `get_subtree_hashes`.
+
+        Parameters:
+            old_hashes (Dict[str, Tuple[str, int, bool]]): The hashes from the previous visit.
+            new_hashes (Dict[str, Tuple[str, int, bool]]): The hashes from the current visit.
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: The changed, added and removed paths.
+                                                    A change deep in the tree also changes every ancestor.
+        """
+        changed = []
+        added = []
+        for path, (subtree_hash, _, _) in new_hashes.items():
+            old = old_hashes.get(path)
+            if old is None:
+                added.append(path)
+            elif old[0] != subtree_hash:
+                changed.append(path)
+        removed = [path for path in old_hashes if path not in new_hashes]
+        return changed, added, removed
+
+    def get_sections(self, hashes: Dict[str, Tuple[str, int, bool]], max_section_len: int = 2000) -> List[str]:
+        """
+        Split a page into sections used as the unit of incremental re-extraction.
+
+        A section is the outermost element whose text is at most `max_section_len` characters long. Elements
+        that are too long are split into their children, unless they hold text directly, in which case they
+        become a section anyway.
+
+        Parameters:
+            hashes (Dict[str, Tuple[str, int, bool]]): The hashes returned by `get_subtree_hashes`.
+            max_section_len (int, default=2000): The maximum text length of a section that can still be split.
+
+        Returns:
+            List[str]: The section paths in document order.
+        """
+        sections = []
+        section_prefix = None
+        for path, (_, text_len, splittable) in hashes.items():
+            if section_prefix is not None and path.startswith(section_prefix):
+                continue
+            section_prefix = None
+            if text_len <= max_section_len or not splittable:
+                sections.append(path)
+                section_prefix = path + "."
+        return sections
 
 
     def parse_media_node(self, node: Node) -> Optional[Dict[str, Union[str, List[str]]]]:
@@ -381,6 +519,7 @@ class SelectolaxParser():
     
 
 
+    @stats.instrument("parser.parse_media_nodes")
     def parse_media_nodes(self, start_node: Node, end_node: Optional[Node] = None, 
                              include_self: bool = True, extract_text_within_headers: bool = False, children_only: bool = False) -> Iterator[Dict[str, Union[str, List[str]]]]:
         
@@ -417,6 +556,7 @@ class SelectolaxParser():
             yield self.parse_media_node(node)
 
 
+    @stats.instrument("parser.count_nodes", lambda result: {"nodes": result[0]})
     def count_nodes(self, start_node: Node, end_node: Optional[Node] = None, include_self: bool = True, ignore_nodes: List[Node] = [], children_only: bool = False) -> Tuple[int, int]:
 
         """
@@ -453,6 +593,7 @@ class SelectolaxParser():
         return node_count, text_count
 
         
+    @stats.instrument("parser.get_text_nodes", lambda result: {"nodes": len(result)})
     def get_text_nodes(self, start_node: Node, end_node: Optional[Node] = None, include_self: bool = True, ignore_nodes: List[Node] = [], children_only: bool = False) -> List[Node]:
         # might be better to have a get_x_nodes func instead of separate funcs for each type of node
         """
@@ -482,6 +623,7 @@ class SelectolaxParser():
     
     
 
+    @stats.instrument("parser.get_text_lens", lambda result: {"nodes": len(result)})
     def get_text_lens(self, start_node: Node, end_node: Optional[Node] = None, include_self: bool = True, ignore_nodes: List[Node] = []) -> List[int]:
 
         """
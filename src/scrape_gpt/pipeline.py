@@ -0,0 +1,297 @@
+import queue
+import threading
+from dataclasses import dataclass
+from typing import List, Tuple, Dict, Optional, Any, Callable, Iterable, Iterator
+
+import torch
+
+from scrape_gpt.parser import SelectolaxParser
+from scrape_gpt.scraper import LlmScraper
+
+_stop_item = object()
+
+
+@dataclass
+class PageResult():
+    url: str
+    html: Optional[str] = None
+    parser: Optional[SelectolaxParser] = None
+    texts: Optional[List[str]] = None
+    batches: Optional[List[List[str]]] = None
+    embeddings: Optional[torch.Tensor] = None
+    results: Optional[List[Tuple[str, List[Tuple[str, float]]]]] = None
+    error: Optional[BaseException] = None
+    failed_stage: Optional[str] = None
+
+    def __str__(self):
+        return f"PageResult for {self.url}"
+
+    def __repr__(self):
+        return f"PageResult({self.url})"
+
+
+@dataclass
+class PipelineStage():
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+    queue_size: int = 8
+    # called on every worker thread of the stage when it exits, e.g. to release per-thread resources
+    teardown: Optional[Callable[[], None]] = None
+
+
+class StreamingPipeline():
+    def __init__(self, stages: List[PipelineStage], poll_interval: float = 0.1):
+        """
+        Run a chain of stages concurrently, each with its own worker threads, connected by bounded queues.
+
+        A full queue blocks the stage feeding it, so a slow stage throttles everything before it instead of
+        letting work pile up in memory. Results are yielded as soon as the last stage finishes them, so they
+        come out in completion order, not input order.
+
+        Parameters:
+            stages (List[PipelineStage]): The stages in order. Each stage function takes the output of the previous one.
+            poll_interval (float, default=0.1): How often blocked workers check whether the pipeline was stopped.
+        """
+        self.stages = stages
+        self.poll_interval = poll_interval
+
+    def _put(self, q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue, stop: threading.Event) -> Any:
+        while not stop.is_set():
+            try:
+                return q.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+        return _stop_item
+
+    def _worker(self, stage: PipelineStage, in_queue: queue.Queue, out_queue: queue.Queue,
+                stop: threading.Event, finished: List[int], lock: threading.Lock, errors: List[BaseException]) -> None:
+        try:
+            self._work(stage, in_queue, out_queue, stop, finished, lock, errors)
+        finally:
+            if stage.teardown is not None:
+                stage.teardown()
+
+    def _work(self, stage: PipelineStage, in_queue: queue.Queue, out_queue: queue.Queue,
+              stop: threading.Event, finished: List[int], lock: threading.Lock, errors: List[BaseException]) -> None:
+        while True:
+            item = self._get(in_queue, stop)
+            if item is _stop_item:
+                break
+            try:
+                result = stage.func(item)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                return
+            if not self._put(out_queue, result, stop):
+                return
+
+        # the last worker of a stage to finish tells every worker of the next stage to stop
+        with lock:
+            finished[0] += 1
+            last = finished[0] == stage.workers
+        if last:
+            self._put(out_queue, _stop_item, stop)
+
+    def run(self, items: Iterable[Any]) -> Iterator[Any]:
+        """
+        Feed `items` through the stages and yield the results as they complete.
+
+        Closing the returned generator early stops all workers. If a stage function or iterating `items` raises,
+        the pipeline stops and the exception is re-raised here.
+
+        Parameters:
+            items (Iterable[Any]): The inputs of the first stage.
+
+        Yields:
+            Any: The outputs of the last stage.
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        out_queue = queue.Queue(maxsize=self.stages[-1].queue_size)
+        threads = []
+        errors = []
+
+        for i, stage in enumerate(self.stages):
+            next_queue = queues[i + 1] if i + 1 < len(self.stages) else out_queue
+            # every worker of a stage needs its own stop item, so the queue in between fans one stop item out
+            stage_queue = _StopFanOutQueue(queues[i], stage.workers)
+            queues[i] = stage_queue
+            finished = [0]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage, stage_queue, next_queue, stop, finished, lock, errors),
+                                          name=f"{stage.name}-worker", daemon=True)
+                threads.append(thread)
+
+        def feed():
+            try:
+                for item in items:
+                    if not self._put(queues[0], item, stop):
+                        return
+            except BaseException as e:
+                # a failing source stops the pipeline like a failing stage
+                errors.append(e)
+                stop.set()
+                return
+            self._put(queues[0], _stop_item, stop)
+
+        feeder = threading.Thread(target=feed, name="pipeline-feeder", daemon=True)
+        threads.append(feeder)
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(out_queue, stop)
+                if item is _stop_item:
+                    break
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+
+class _StopFanOutQueue():
+    # wraps a stage's input queue so a single stop item stops all of its workers
+    def __init__(self, q: queue.Queue, workers: int):
+        self.q = q
+        self.workers = workers
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> None:
+        self.q.put(item, timeout=timeout)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        item = self.q.get(timeout=timeout)
+        if item is _stop_item and self.workers > 1:
+            # hand the stop item on to the next worker of this stage
+            self.q.put(item)
+        return item
+
+
+class ScrapePipeline(StreamingPipeline):
+    def __init__(self,
+                 scraper: LlmScraper,
+                 queries: List[str],
+                 top_k: Optional[int] = None,
+                 query_instruction: str = "retrieve similar",
+                 extract_func: Optional[Callable[[SelectolaxParser], List[str]]] = None,
+                 batch_size: int = 32,
+                 max_text_len: Optional[int] = None,
+                 workers: Optional[Dict[str, int]] = None,
+                 queue_size: int = 8):
+        """
+        Streaming fetch -> parse -> extract -> chunk -> embed -> retrieve pipeline over many urls.
+
+        Network, parsing and inference overlap: while one page is in the model, others are being downloaded
+        and parsed. The retrieval model of `scraper` is shared by all embed workers and the queries are embedded
+        once up front.
+
+        Parameters:
+            scraper (LlmScraper): Holds the retrieval model and tokenizer. It doesn't need a url.
+            queries (List[str]): The retrieval queries run against every page.
+            top_k (Optional[int], default=None): Number of results per query and page. None returns every text.
+            query_instruction (str, default="retrieve similar"): Prepended to the queries.
+            extract_func (Optional[Callable[[SelectolaxParser], List[str]]], default=None): Extracts the texts of a page.
+                                                                                            Defaults to all text nodes.
+            batch_size (int, default=32): Number of texts per forward pass.
+            max_text_len (Optional[int], default=None): Texts longer than this are split into several chunks.
+            workers (Optional[Dict[str, int]], default=None): Worker count per stage name, e.g. {"fetch": 8}.
+                                                               Defaults to 4 fetch workers and 1 worker for the other stages.
+            queue_size (int, default=8): Capacity of the queue in front of each stage.
+
+        Example:
+            for page in ScrapePipeline(LlmScraper(), ["price"], top_k=3).run(urls):
+                print(page.url, page.error or page.results)
+        """
+        self.scraper = scraper
+        self.queries = queries
+        self.top_k = top_k
+        self.extract_func = extract_func or self.extract_text_nodes
+        self.batch_size = batch_size
+        self.max_text_len = max_text_len
+        self.query_vecs = scraper.embed_texts(scraper._retrieval_format(query_instruction, queries))
+
+        stage_workers = {"fetch": 4, "parse": 1, "extract": 1, "chunk": 1, "embed": 1, "retrieve": 1}
+        if workers:
+            stage_workers.update(workers)
+        stage_funcs = [("fetch", self.fetch), ("parse", self.parse), ("extract", self.extract),
+                       ("chunk", self.chunk), ("embed", self.embed), ("retrieve", self.retrieve)]
+        # fetch workers are new threads on every run, each closes its session when it exits
+        teardowns = {"fetch": scraper.close_session}
+        stages = [PipelineStage(name, self._guard(name, func), stage_workers[name], queue_size, teardowns.get(name))
+                  for name, func in stage_funcs]
+        super().__init__(stages)
+
+    def _guard(self, name: str, func: Callable[[PageResult], PageResult]) -> Callable[[PageResult], PageResult]:
+        # a failing page is passed along with its error instead of taking the pipeline down
+        def guarded(page: PageResult) -> PageResult:
+            if page.error is not None:
+                return page
+            try:
+                return func(page)
+            except Exception as e:
+                page.error = e
+                page.failed_stage = name
+                page.html = None
+                page.parser = None
+                return page
+        return guarded
+
+    def run(self, urls: Iterable[str]) -> Iterator[PageResult]:
+        return super().run(PageResult(url) for url in urls)
+
+    def extract_text_nodes(self, parser: SelectolaxParser) -> List[str]:
+        return [node.text_content.strip() for node in parser.get_text_nodes(parser.tree.root)]
+
+    def fetch(self, page: PageResult) -> PageResult:
+        page.html = self.scraper.fetch_html(page.url)
+        return page
+
+    def parse(self, page: PageResult) -> PageResult:
+        page.parser = SelectolaxParser(page.html)
+        page.html = None
+        return page
+
+    def extract(self, page: PageResult) -> PageResult:
+        page.texts = self.extract_func(page.parser)
+        page.parser = None
+        return page
+
+    def chunk(self, page: PageResult) -> PageResult:
+        texts = page.texts
+        if self.max_text_len is not None:
+            texts = [text[i:i + self.max_text_len] for text in texts for i in range(0, len(text), self.max_text_len)]
+        page.texts = texts
+        page.batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        return page
+
+    def embed(self, page: PageResult) -> PageResult:
+        if page.batches:
+            page.embeddings = torch.cat([self.scraper.embed_texts(batch) for batch in page.batches])
+        else:
+            page.embeddings = self.query_vecs.new_zeros((0, self.query_vecs.shape[-1]))
+        page.batches = None
+        return page
+
+    def retrieve(self, page: PageResult) -> PageResult:
+        cosine_scores = self.query_vecs @ page.embeddings.T
+        top_k = self.top_k
+        if top_k is not None:
+            top_k = min(top_k, len(page.texts))
+        page.results = self.scraper._format_retrieval_results(self.queries, page.texts, cosine_scores, top_k)
+        page.embeddings = None
+        return page
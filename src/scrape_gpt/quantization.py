@@ -0,0 +1,115 @@
+import copy
+import time
+from typing import List, Tuple, Dict, Optional, TYPE_CHECKING
+
+import torch
+
+if TYPE_CHECKING:
+    from scrape_gpt.scraper import LlmScraper
+
+cpu_inference_modes = ["int8", "bf16"]
+
+
+def set_cpu_threads(num_threads: Optional[int] = None, num_interop_threads: Optional[int] = None) -> None:
+    """
+    Set the number of intra-op and inter-op threads torch uses on the CPU.
+
+    Parameters:
+        num_threads (Optional[int], default=None): Threads used inside a single op, e.g. a matmul. None leaves it unchanged.
+        num_interop_threads (Optional[int], default=None): Threads used to run independent ops in parallel. None leaves it unchanged.
+                                                           Torch only allows setting this before any parallel work ran.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None and torch.get_num_interop_threads() != num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            raise RuntimeError("num_interop_threads has to be set before torch runs any parallel work, "
+                               "e.g. before the first model is loaded.") from e
+
+
+def optimize_for_cpu(model: torch.nn.Module, mode: str = "int8", inplace: bool = False) -> torch.nn.Module:
+    """
+    Prepare a retrieval model for CPU inference.
+
+    Parameters:
+        model (torch.nn.Module): The fp32 model, on the CPU.
+        mode (str, default="int8"): "int8" dynamically quantizes the weights of every linear layer to int8, activations
+                                    are quantized on the fly. "bf16" casts the model to bfloat16, which is only faster on
+                                    CPUs with native bf16 support (e.g. AVX512-BF16 or AMX).
+        inplace (bool, default=False): If True, `model` itself is converted instead of a copy, which saves memory
+                                       when nothing else uses the fp32 model.
+
+    Returns:
+        torch.nn.Module: The optimized model in eval mode.
+    """
+    if mode not in cpu_inference_modes:
+        raise NotImplementedError(f"CPU inference mode {mode} not implemented yet.")
+    if any(param.device.type != "cpu" for param in model.parameters()):
+        raise ValueError("CPU inference modes need the model on the CPU, don't pass a GPU device_map.")
+
+    model = model.eval()
+    if mode == "int8":
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=inplace)
+    if not inplace:
+        model = copy.deepcopy(model)
+    return model.to(torch.bfloat16)
+
+
+def _timed_top_k(scraper: "LlmScraper", queries: List[str], corpus: List[str], top_k: int, repeats: int) -> Tuple[torch.Tensor, float]:
+    indices = None
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        scores = scraper.text_retrieval(queries, corpus, top_k=top_k, only_cosine=True)
+        latencies.append(time.perf_counter() - start)
+        indices = scores.indices
+    return indices, min(latencies)
+
+
+def evaluate_inference_mode(baseline: "LlmScraper", candidate: "LlmScraper", queries: List[str], corpus: List[str],
+                            top_k: int = 10, repeats: int = 3, warmup: int = 1) -> Dict[str, float]:
+    """
+    Compare the retrieval results and latency of an optimized scraper against the fp32 baseline.
+
+    Both scrapers run `text_retrieval` on the same queries and corpus. Recall is the fraction of the baseline's
+    top `top_k` texts per query that the candidate also returns in its top `top_k`.
+
+    Parameters:
+        baseline (LlmScraper): Scraper with the fp32 model.
+        candidate (LlmScraper): Scraper with the optimized model, e.g. created with cpu_inference_mode="int8".
+        queries (List[str]): The queries.
+        corpus (List[str]): The texts to retrieve from, ideally from representative pages.
+        top_k (int, default=10): Number of results compared per query.
+        repeats (int, default=3): Timed runs per scraper, the fastest one is reported.
+        warmup (int, default=1): Untimed runs per scraper before timing.
+
+    Returns:
+        Dict[str, float]: "recall_at_k", "baseline_latency" and "candidate_latency" (seconds) and "speedup".
+
+    Example:
+        baseline = LlmScraper()
+        candidate = LlmScraper(model=baseline.model, tokenizer=baseline.tokenizer, load_retrieval_model=False, cpu_inference_mode="int8")
+        stats = evaluate_inference_mode(baseline, candidate, queries, corpus)
+        if stats["recall_at_k"] >= 0.95: ...
+    """
+    top_k = min(top_k, len(corpus))
+    for scraper in (baseline, candidate):
+        for _ in range(warmup):
+            scraper.text_retrieval(queries, corpus, top_k=top_k, only_cosine=True)
+
+    baseline_indices, baseline_latency = _timed_top_k(baseline, queries, corpus, top_k, repeats)
+    candidate_indices, candidate_latency = _timed_top_k(candidate, queries, corpus, top_k, repeats)
+
+    hits = 0
+    for baseline_row, candidate_row in zip(baseline_indices.tolist(), candidate_indices.tolist()):
+        hits += len(set(baseline_row) & set(candidate_row))
+    recall = hits / (len(queries) * top_k) if queries and top_k else 1.0
+
+    return {
+        "recall_at_k": recall,
+        "baseline_latency": baseline_latency,
+        "candidate_latency": candidate_latency,
+        "speedup": baseline_latency / candidate_latency if candidate_latency else float("inf"),
+    }
@@ -1,6 +1,16 @@
+import threading
 import requests
 from scrape_gpt.parser import SelectolaxParser
+from scrape_gpt.frontier import check_html_response
+from scrape_gpt.dedup import TextDeduplicator
+from scrape_gpt.incremental import PageSnapshot, refresh_sections
+from scrape_gpt.quantization import set_cpu_threads, optimize_for_cpu
+from scrape_gpt.parallel import prefetch_map, ShardedEncoder
+from scrape_gpt.lexical import BM25Index
+from scrape_gpt.instrumentation import stats
+from selectolax.parser import Node
 from typing import List, Dict, Tuple, Union, Optional
+from urllib.parse import urlparse
 from transformers import BertTokenizerFast, BertModel
 import torch
 
@@ -8,7 +18,7 @@ import torch
 class LlmScraper():
     
     def __init__(self, 
-                 url: str, 
+                 url: Optional[str]=None, 
                  parser: str="selectolax", 
                  load_retrieval_model: bool=True, 
                  model_name: str="BAAI/bge-large-en-v1.5",
@@ -16,17 +26,42 @@ class LlmScraper():
                  device_map: Optional[Union[int, str, torch.device, Dict[str, Union[int, str, torch.device]]]]=None,
                  model: Optional[BertModel]=None,
                  tokenizer: Optional[BertTokenizerFast]=None,
+                 cpu_inference_mode: Optional[str]=None,
+                 num_threads: Optional[int]=None,
+                 num_interop_threads: Optional[int]=None,
+                 batch_size: Optional[int]=None,
+                 prefetch_batches: int=2,
+                 keep_html: bool=True,
+                 html: Optional[str]=None,
+                 timeout: Optional[float]=30.0,
                  ):
-        self.url = url
-        self.html = self.fetch_html(self.url)
-        self.parser = self.get_parser(parser)
+        self.parser_name = parser
+        self.keep_html = keep_html
+        self.timeout = timeout
+        # requests sessions aren't thread safe, every thread fetching through the scraper gets its own
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._sessions_lock = threading.Lock()
+        self.url = None
+        self.html = None
+        self.parser = None
+        # without a page the scraper only holds the retrieval model, e.g. to be shared by a pipeline
+        if url is not None or html is not None:
+            self.load(url, html)
         self.model = model
         self.tokenizer = tokenizer
         self.hf_cache_dir = hf_cache_dir
 
+        self.cpu_inference_mode = cpu_inference_mode
+        self.batch_size = batch_size
+        self.prefetch_batches = prefetch_batches
+
         if device_map and (isinstance(device_map, int) or isinstance(device_map, torch.device)):
             device_map = {"": device_map}
 
+        # must run before the model is loaded, torch rejects inter-op thread changes after parallel work started
+        set_cpu_threads(num_threads, num_interop_threads)
+
         if load_retrieval_model:
             self.init_retrieval_model(model_name, 
                                       device_map,
@@ -36,13 +71,101 @@ class LlmScraper():
             self.device = model.device
         else:
             self.device = None
+
+        # a model that was passed in may be shared, so it is converted as a copy
+        if cpu_inference_mode and self.model is not None:
+            self.model = optimize_for_cpu(self.model, cpu_inference_mode, inplace=model is None)
         
                 
                 
 
 
+    def __enter__(self) -> "LlmScraper":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def load(self, url: Optional[str]=None, html: Optional[str]=None) -> "LlmScraper":
+        """
+        Point the scraper at a new page, keeping the retrieval model and tokenizer loaded.
+
+        The previous page's parser and raw HTML are released before the new page is parsed, so a scraper reused
+        over many pages only ever holds one page. With `keep_html=False` the raw HTML is dropped as soon as it is
+        parsed. Nodes from an earlier page that are still referenced elsewhere keep that page's tree alive.
+
+        Parameters:
+            url (Optional[str], default=None): The http(s) url of the page to fetch.
+            html (Optional[str], default=None): The HTML of the page itself. Exactly one of `url` and `html` has to be given.
+
+        Returns:
+            LlmScraper: The scraper itself, so calls can be chained.
+
+        Example:
+            with LlmScraper() as scraper:
+                for url in urls:
+                    results = scraper.load(url).text_retrieval(queries, corpus_from(scraper.parser))
+        """
+        if (url is None) == (html is None):
+            raise ValueError("Pass exactly one of url and html.")
+        if url is not None and urlparse(url).scheme not in ("http", "https"):
+            raise ValueError(f"{url} is not an http(s) url, pass the page with html= to scrape it directly.")
+
+        self.clear()
+        if url is not None:
+            self.url = url
+            self.html = self.fetch_html(url)
+        else:
+            self.html = html
+        self.parser = self.get_parser(self.parser_name)
+        if not self.keep_html:
+            self.html = None
+        return self
+
+    def clear(self) -> None:
+        # release the current page, the model stays loaded
+        self.url = None
+        self.html = None
+        self.parser = None
+
+    def close(self) -> None:
+        self.clear()
+        self.model = None
+        self.tokenizer = None
+        self.device = None
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+            self._local = threading.local()
+        for session in sessions:
+            session.close()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def close_session(self) -> None:
+        # close the calling thread's session, threads that fetch and then exit should call it so sessions don't pile up
+        session = getattr(self._local, "session", None)
+        if session is None:
+            return
+        self._local.session = None
+        with self._sessions_lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+        session.close()
+
     def fetch_html(self, url: str) -> str:
-        return requests.get(url).text
+        # error statuses and non-html responses raise, so a pipeline reports them as failed pages
+        start = stats.start()
+        response = self.session.get(url, timeout=self.timeout)
+        check_html_response(response)
+        stats.record("scraper.fetch_html", start, bytes=len(response.content))
+        return response.text
     
 
     def init_retrieval_model(self, 
@@ -60,32 +183,90 @@ class LlmScraper():
     def _retrieval_format(self, instruction: str, texts: List[str]) -> List[str]:
         return [f"{instruction} {text}" for text in texts]
     
+    def _tokenize(self, texts: List[str]):
+        start = stats.start()
+        tok_inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
+        if start is not None:
+            stats.record("scraper.tokenize", start, texts=len(texts), tokens=int(tok_inputs["attention_mask"].sum()))
+        return tok_inputs
+
+    def _forward(self, tok_inputs) -> torch.Tensor:
+        start = stats.start()
+        with torch.no_grad():
+            all_vecs = self.model(**tok_inputs.to(self.device))
+
+        sentence_embeddings = all_vecs[0][:, 0].float()
+        sentence_embeddings = torch.nn.functional.normalize(sentence_embeddings, p=2, dim=-1)
+        if start is not None:
+            batch_size, seq_len = tok_inputs["input_ids"].shape
+            stats.record("scraper.forward", start, batch_size=batch_size, padded_tokens=batch_size * seq_len)
+        return sentence_embeddings
+
+    def embed_texts(self, texts: List[str]) -> torch.Tensor:
+        if self.batch_size is None or len(texts) <= self.batch_size:
+            return self._forward(self._tokenize(texts))
+
+        # batches of similar length pad less, the original order is restored below
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [[texts[i] for i in order[start:start + self.batch_size]] for start in range(0, len(texts), self.batch_size)]
+
+        # the next batches are tokenized on a background thread while the current one runs through the model
+        sorted_embeddings = torch.cat([self._forward(tok_inputs) for tok_inputs in prefetch_map(self._tokenize, batches, self.prefetch_batches)])
+        sentence_embeddings = torch.empty_like(sorted_embeddings)
+        sentence_embeddings[torch.tensor(order, device=sorted_embeddings.device)] = sorted_embeddings
+        return sentence_embeddings
+
+    @stats.instrument("scraper.text_retrieval")
     def text_retrieval(self,
                         queries: List[str], 
                         corpus: List[str], 
                         top_k: Optional[int]=None,
                         query_instruction: str="retrieve similar", 
     
-                        only_cosine: bool=False) -> List[List[Tuple[str, float]]]:
+                        only_cosine: bool=False,
+                        deduplicator: Optional[TextDeduplicator]=None,
+                        encoder: Optional[ShardedEncoder]=None,
+                        prefilter_top_n: Optional[int]=None) -> List[List[Tuple[str, float]]]:
         formatted_queries = self._retrieval_format(query_instruction, queries)
 
-        tok_inputs = self.tokenizer(formatted_queries + corpus, padding=True, truncation=True, return_tensors="pt")
-        with torch.no_grad():
-            all_vecs = self.model(**tok_inputs.to(self.device))
+        # embed each unique text once, the scores are fanned back out to every occurrence below
+        if deduplicator is not None:
+            unique_corpus, inverse = deduplicator.dedup(corpus)
+        else:
+            unique_corpus, inverse = corpus, None
 
+        # BM25 picks the candidates of every query, only those go through the model. Texts that aren't
+        # candidates get a score of -inf. Falls through to scoring everything if some query has no lexical match
+        candidates = None
+        if prefilter_top_n is not None and len(unique_corpus) > prefilter_top_n:
+            candidates = BM25Index(unique_corpus).get_candidates(queries, prefilter_top_n, min_candidates=top_k or 0)
+        dense_corpus = unique_corpus if candidates is None else [unique_corpus[i] for i in candidates]
 
-        sentence_embeddings = all_vecs[0][:, 0]
-        sentence_embeddings = torch.nn.functional.normalize(sentence_embeddings, p=2, dim=-1)
+        if encoder is not None:
+            sentence_embeddings = encoder.encode(formatted_queries + dense_corpus).to(self.device)
+        else:
+            sentence_embeddings = self.embed_texts(formatted_queries + dense_corpus)
 
         query_vecs = sentence_embeddings[:len(formatted_queries)]
         corpus_vecs = sentence_embeddings[len(formatted_queries):]
 
         cosine_scores = query_vecs @ corpus_vecs.T
+        if candidates is not None:
+            all_scores = cosine_scores.new_full((len(queries), len(unique_corpus)), float("-inf"))
+            all_scores[:, torch.tensor(candidates, device=cosine_scores.device)] = cosine_scores
+            cosine_scores = all_scores
+        if inverse is not None:
+            cosine_scores = cosine_scores[:, torch.tensor(inverse, device=cosine_scores.device)]
 
 
+        return self._format_retrieval_results(queries, corpus, cosine_scores, top_k, only_cosine)
 
+    def _format_retrieval_results(self, queries: List[str], corpus: List[str], cosine_scores: torch.Tensor,
+                                  top_k: Optional[int]=None, only_cosine: bool=False) -> List[List[Tuple[str, float]]]:
         if top_k is not None:
+            start = stats.start()
             cosine_scores = cosine_scores.topk(top_k, dim=-1)
+            stats.record("scraper.top_k", start)
 
         if only_cosine:
             return cosine_scores
@@ -106,6 +287,48 @@ class LlmScraper():
 
         return final_results
 
+    def incremental_text_retrieval(self,
+                                   queries: List[str],
+                                   snapshot: Optional[PageSnapshot]=None,
+                                   top_k: Optional[int]=None,
+                                   query_instruction: str="retrieve similar",
+                                   only_cosine: bool=False,
+                                   deduplicator: Optional[TextDeduplicator]=None,
+                                   max_section_len: int=2000) -> Tuple[List[List[Tuple[str, float]]], PageSnapshot]:
+        # only sections that changed since `snapshot` are sent through the model, the stored scores of the rest are reused
+        def extract_sections(section_nodes: Dict[str, Node]) -> Dict[str, Tuple[List[str], List[List[float]]]]:
+            section_texts = {}
+            for path, node in section_nodes.items():
+                section_texts[path] = [text_node.text_content.strip() for text_node in self.parser.get_text_nodes(node)]
+            corpus = [text for texts in section_texts.values() for text in texts]
+            if not corpus:
+                return {path: (texts, [[] for _ in queries]) for path, texts in section_texts.items()}
+
+            cosine_scores = self.text_retrieval(queries, corpus, query_instruction=query_instruction,
+                                                only_cosine=True, deduplicator=deduplicator).tolist()
+            results = {}
+            start = 0
+            for path, texts in section_texts.items():
+                end = start + len(texts)
+                results[path] = (texts, [scores[start:end] for scores in cosine_scores])
+                start = end
+            return results
+
+        new_snapshot, _ = refresh_sections(self.parser, self.url, extract_sections, snapshot,
+                                           result_key=[query_instruction] + list(queries), max_section_len=max_section_len)
+
+        corpus = []
+        query_scores = [[] for _ in queries]
+        for texts, scores in new_snapshot.section_results.values():
+            corpus.extend(texts)
+            for i, section_scores in enumerate(scores):
+                query_scores[i].extend(section_scores)
+
+        cosine_scores = torch.tensor(query_scores, device=self.device).reshape(len(queries), len(corpus))
+        if top_k is not None:
+            top_k = min(top_k, len(corpus))
+        return self._format_retrieval_results(queries, corpus, cosine_scores, top_k, only_cosine), new_snapshot
+
 
 
     def get_parser(self, parser: str = "selectolax"):
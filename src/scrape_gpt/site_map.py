@@ -2,6 +2,13 @@ from dataclasses import dataclass
 import yaml
 import tldextract
 from urllib.parse import urlparse
+from scrape_gpt.instrumentation import stats
+
+
+def get_domain(url):
+    # the registered domain, e.g. "example.co.uk" for "https://shop.example.co.uk/cart"
+    url_info = tldextract.extract(url)
+    return f'{url_info.domain}.{url_info.suffix}'
 
 
 def iter_llm_info(llm_info):
@@ -142,6 +149,7 @@ class SiteMapEntry(DictIterableMixin):
 
         return final_data
     
+    @stats.instrument("site_map.entry.get_llm_view")
     def get_llm_view(self, ignored_info = [],  include_children = False, include_sub_targets = False):
         
         # return llm self.info with ignored_info removed
@@ -161,10 +169,9 @@ class SiteMap(LlmDictMixin):
         self.description = description
 
         if auto_url_info:
-            url_info = tldextract.extract(url)
             parsed_url = urlparse(url)
             if not domain_url:
-                domain_url = f'{url_info.domain}.{url_info.suffix}'
+                domain_url = get_domain(url)
             if not subdomain_url:
                 subdomain_url = parsed_url.netloc
             if not page_url_template:
@@ -177,7 +184,7 @@ class SiteMap(LlmDictMixin):
                     split_path = [path for path in split_path if path]
                     if not split_path:
                         page_url_template = parsed_url.netloc
-                    if len(split_path) > 1:
+                    elif len(split_path) > 1:
                         page_url_template = f'{parsed_url.netloc}/{split_path[:-1]}'
                     else:
                         page_url_template = f'{parsed_url.netloc}/{split_path[0]}'
@@ -204,6 +211,7 @@ class SiteMap(LlmDictMixin):
         return new_entry
     
 
+    @stats.instrument("site_map.get_llm_view")
     def get_llm_view(self,  ignored_site_info = [], ignore_url_info = False, include_children = False, include_sub_targets = False, ignored_info = []):
         llm_info = []
         llm_string = ""
@@ -0,0 +1,169 @@
+import re
+from collections import Counter
+from itertools import islice
+from typing import List, Tuple, Optional, Iterable
+
+from selectolax.parser import Node
+
+from scrape_gpt.dedup import normalize_text
+from scrape_gpt.parser import SelectolaxParser
+from scrape_gpt.site_map import SiteMap, get_domain
+
+# attributes that are part of a region's content, the rest (classes, ids, data attributes) often vary per page
+template_attributes = ["src", "alt"]
+_index_re = re.compile(r"\[\d+\]")
+
+
+class TemplateProfiler():
+    def __init__(self, site_map: SiteMap, min_pages: int = 3, max_pages: Optional[int] = 50,
+                 path_threshold: float = 0.8, text_threshold: float = 0.8, min_text_len: int = 1):
+        """
+        Learn which regions of a site's pages are template chrome (headers, sidebars, footers, cookie banners).
+
+        Every element of a profiled page gets a fingerprint made of its dotted tag path (the same format as
+        `get_media_paths`) and its subtree hash from `get_subtree_hashes`. A fingerprint that shows up on at least
+        `path_threshold` of the profiled pages marks a template region. Normalized texts are counted the same way
+        so repeated strings like "Read more" can be dropped before embedding even when their path changes.
+
+        Parameters:
+            site_map (SiteMap): The site map whose domain is being profiled. Pages from other domains are rejected.
+            min_pages (int, default=3): Number of profiled pages needed before anything is treated as template.
+            max_pages (Optional[int], default=50): Stop learning after this many pages. None keeps learning forever.
+            path_threshold (float, default=0.8): Fraction of pages a (path, content) fingerprint must appear on.
+            text_threshold (float, default=0.8): Fraction of pages a text must appear on.
+            min_text_len (int, default=1): Subtrees with less text than this are never treated as template.
+        """
+        self.site_map = site_map
+        self.domain_url = site_map.domain_url
+        self.min_pages = min_pages
+        self.max_pages = max_pages
+        self.path_threshold = path_threshold
+        self.text_threshold = text_threshold
+        self.min_text_len = min_text_len
+
+        self.num_pages = 0
+        self.path_counts: Counter = Counter()
+        self.text_counts: Counter = Counter()
+
+    def __str__(self):
+        return f"TemplateProfiler for {self.domain_url} with {self.num_pages} pages"
+
+    def __repr__(self):
+        return f"TemplateProfiler({self.domain_url})"
+
+    @property
+    def is_ready(self) -> bool:
+        return self.num_pages >= self.min_pages
+
+    def check_domain(self, url: str) -> None:
+        if get_domain(url) != self.domain_url:
+            raise ValueError(f"Page {url} is not part of {self.domain_url}")
+
+    def fingerprint_nodes(self, parser: SelectolaxParser) -> List[Tuple[str, Node, Tuple[str, str], int]]:
+        """
+        Fingerprint every element below the root of the page held by `parser`.
+
+        The content hashes come from `SelectolaxParser.get_subtree_hashes`, covering only the "src" and "alt"
+        attributes so per-page attributes like an "active" class on the current menu item don't hide the template.
+        The sibling indices are dropped from the paths, so a region still matches when the number of elements
+        before it changes between pages.
+
+        Parameters:
+            parser (SelectolaxParser): The parsed page.
+
+        Returns:
+            List[Tuple[str, Node, Tuple[str, str], int]]:
+                (indexed path, node, (path, content hash), text length) for every element below the root, in document order.
+        """
+        hashes, nodes = parser.get_subtree_hashes(attributes=template_attributes)
+        fingerprints = []
+        # the root is never template, it would remove the whole page
+        for indexed_path, (subtree_hash, text_len, _) in islice(hashes.items(), 1, None):
+            path = _index_re.sub("", indexed_path)
+            fingerprints.append((indexed_path, nodes[indexed_path], (path, subtree_hash), text_len))
+        return fingerprints
+
+    def add_page(self, parser: SelectolaxParser, url: Optional[str] = None) -> bool:
+        """
+        Add the page held by `parser` to the profile.
+
+        Parameters:
+            parser (SelectolaxParser): The parsed page.
+            url (Optional[str], default=None): The page url, used to check the page belongs to the profiled domain.
+
+        Returns:
+            bool: False if the profile already reached `max_pages` and the page was not added.
+        """
+        if url is not None:
+            self.check_domain(url)
+        if self.max_pages is not None and self.num_pages >= self.max_pages:
+            return False
+
+        page_paths = set()
+        for _, _, fingerprint, text_len in self.fingerprint_nodes(parser):
+            if text_len >= self.min_text_len:
+                page_paths.add(fingerprint)
+
+        page_texts = set()
+        for node in parser.get_text_nodes(parser.tree.root):
+            text = normalize_text(node.text_content)
+            if len(text) >= self.min_text_len:
+                page_texts.add(text)
+
+        self.path_counts.update(page_paths)
+        self.text_counts.update(page_texts)
+        self.num_pages += 1
+        return True
+
+    def is_template_path(self, fingerprint: Tuple[str, str]) -> bool:
+        return self.is_ready and self.path_counts[fingerprint] >= self.path_threshold * self.num_pages
+
+    def is_template_text(self, text: str) -> bool:
+        return self.is_ready and self.text_counts[normalize_text(text)] >= self.text_threshold * self.num_pages
+
+    def get_template_nodes(self, parser: SelectolaxParser) -> List[Node]:
+        """
+        Find the outermost template subtrees of the page held by `parser`.
+
+        Parameters:
+            parser (SelectolaxParser): The parsed page.
+
+        Returns:
+            List[Node]: Template nodes. Descendants of a returned node are not returned themselves.
+
+        Example:
+            After profiling a few pages sharing <header><nav>Home About</nav></header>, calling this with a new
+            page of the site returns its <header> node.
+        """
+        if not self.is_ready:
+            return []
+
+        template_nodes = []
+        skip_path = None
+        for indexed_path, node, fingerprint, text_len in self.fingerprint_nodes(parser):
+            # fingerprints are in document order, so descendants of a template node directly follow it
+            if skip_path is not None and indexed_path.startswith(skip_path):
+                continue
+            skip_path = None
+            if text_len >= self.min_text_len and self.is_template_path(fingerprint):
+                template_nodes.append(node)
+                skip_path = indexed_path + "."
+        return template_nodes
+
+    def remove_template_nodes(self, parser: SelectolaxParser) -> int:
+        """
+        Decompose the template subtrees of the page held by `parser`, so later traversals and embedding never see them.
+
+        Parameters:
+            parser (SelectolaxParser): The parsed page.
+
+        Returns:
+            int: The number of removed subtrees.
+        """
+        template_nodes = self.get_template_nodes(parser)
+        for node in template_nodes:
+            node.decompose()
+        return len(template_nodes)
+
+    def filter_texts(self, texts: Iterable[str]) -> List[str]:
+        return [text for text in texts if not self.is_template_text(text)]
@@ -0,0 +1,52 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pages = {
+    "/": '<a href="/a">a</a> <a href="/b?y=2&x=1">b</a> <a href="/a#top">a again</a> <a href="/missing">404</a> '
+         '<a href="/logo.png">logo</a> <a href="mailto:me@example.com">mail</a>',
+    "/a": '<a href="/">home</a> <a href="/b?x=1&y=2">b</a> <a href="/c">c</a>',
+    "/b": '<a href="/c">c</a> <a href="/A">not a</a>',
+    "/c": '<p>leaf</p>',
+    "/A": '<p>case sensitive path</p>',
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, time.monotonic()))
+        time.sleep(self.server.response_delay)
+        path = self.path.split("?")[0]
+        if path == "/logo.png":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.end_headers()
+            self.wfile.write(b"\x89PNG")
+            return
+        if path not in pages:
+            self.send_error(404)
+            return
+        body = f"<html><body>{pages[path]}</body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = []
+    server.response_delay = 0.0
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
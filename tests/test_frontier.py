@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+import requests
+
+from scrape_gpt.frontier import CrawlFrontier, get_html
+
+CRAWL_DELAY = 0.1
+
+
+def test_crawl_dedup_and_politeness(site):
+    base = site.base_url
+    frontier = CrawlFrontier([base + "/"], crawl_delay=CRAWL_DELAY)
+    crawled = [url for url, _, _ in frontier.crawl(timeout=5)]
+
+    assert sorted(crawled) == sorted(base + path for path in ["/", "/a", "/b?x=1&y=2", "/c", "/A"])
+    # every url was requested once, including the failed ones
+    requested = [path for path, _ in site.requests]
+    assert len(requested) == len(set(requested)) == 7
+    times = [t for _, t in site.requests]
+    assert all(b - a >= CRAWL_DELAY * 0.9 for a, b in zip(times, times[1:]))
+    assert len(frontier) == 0 and not frontier.in_flight
+    assert frontier.hosts[f"127.0.0.1:{site.server_address[1]}"].active == 0
+
+
+def test_crawl_releases_host_on_error(site):
+    base = site.base_url
+    frontier = CrawlFrontier([base + "/"], crawl_delay=0)
+
+    def fetch_html(url):
+        raise RuntimeError("parser blew up")
+
+    with pytest.raises(RuntimeError):
+        next(frontier.crawl(fetch_html))
+    assert not frontier.in_flight
+    assert frontier.hosts[f"127.0.0.1:{site.server_address[1]}"].active == 0
+
+
+def test_checkpoint_resume(site, tmp_path):
+    base = site.base_url
+    frontier = CrawlFrontier([base + "/"], crawl_delay=0)
+    first = [url for url, _, _ in frontier.crawl(max_pages=2, timeout=5)]
+    checkpoint = tmp_path / "frontier.json"
+    frontier.checkpoint(str(checkpoint))
+
+    resumed = CrawlFrontier.resume(str(checkpoint))
+    assert len(resumed) == len(frontier)
+    rest = [url for url, _, _ in resumed.crawl(timeout=5)]
+
+    assert not set(first) & set(rest)
+    assert sorted(first + rest) == sorted(base + path for path in ["/", "/a", "/b?x=1&y=2", "/c", "/A"])
+    requested = [path for path, _ in site.requests]
+    assert len(requested) == len(set(requested))
+    assert [url for url, _ in resumed.crawled] == first + rest
+    assert set(resumed.entries) == set(first + rest)
+
+
+def test_get_html_rejects_errors_and_non_html(site):
+    base = site.base_url
+    assert "leaf" in get_html(base + "/c", timeout=5)
+    with pytest.raises(requests.HTTPError):
+        get_html(base + "/missing", timeout=5)
+    with pytest.raises(ValueError):
+        get_html(base + "/logo.png", timeout=5)
+
+
+def test_crawl_with_two_workers(site):
+    # slow responses, so both workers have pages in flight at the same time
+    site.response_delay = 0.2
+    base = site.base_url
+    frontier = CrawlFrontier([base + "/"], crawl_delay=0, max_per_host=2)
+    crawled = [[], []]
+
+    def work(i):
+        crawled[i] = [url for url, _, _ in frontier.crawl(timeout=5)]
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+    assert not any(worker.is_alive() for worker in workers)
+
+    # the second worker waits for the links of the seed instead of stopping when the queue is briefly empty
+    assert crawled[1] and crawled[0]
+    assert sorted(crawled[0] + crawled[1]) == sorted(base + path for path in ["/", "/a", "/b?x=1&y=2", "/c", "/A"])
+    requested = [path for path, _ in site.requests]
+    assert len(requested) == len(set(requested))
+    assert len(frontier) == 0 and not frontier.in_flight
@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+pytest.importorskip("torch")
+
+from scrape_gpt.pipeline import PipelineStage, StreamingPipeline
+
+
+def double(x):
+    return 2 * x
+
+
+def test_run():
+    pipeline = StreamingPipeline([PipelineStage("double", double, workers=2), PipelineStage("inc", lambda x: x + 1)])
+    assert sorted(pipeline.run(range(10))) == [2 * x + 1 for x in range(10)]
+
+
+def test_source_error_is_raised():
+    def source():
+        yield 1
+        yield 2
+        raise KeyError("source failed")
+
+    pipeline = StreamingPipeline([PipelineStage("double", double, workers=2)], poll_interval=0.01)
+    with pytest.raises(KeyError, match="source failed"):
+        list(pipeline.run(source()))
+
+
+def test_stage_error_is_raised():
+    def fail_on_six(x):
+        if x == 6:
+            raise ValueError("stage failed")
+        return x
+
+    pipeline = StreamingPipeline([PipelineStage("double", double), PipelineStage("fail", fail_on_six, workers=2)],
+                                 poll_interval=0.01)
+    with pytest.raises(ValueError, match="stage failed"):
+        list(pipeline.run([1, 2, 3, 4, 5, 6]))
+
+
+def test_teardown_runs_on_every_worker():
+    torn_down = []
+    lock = threading.Lock()
+
+    def teardown():
+        with lock:
+            torn_down.append(threading.current_thread().name)
+
+    pipeline = StreamingPipeline([PipelineStage("double", double, workers=3, teardown=teardown)])
+    assert sorted(pipeline.run(range(5))) == [0, 2, 4, 6, 8]
+    assert len(torn_down) == 3
@@ -0,0 +1,64 @@
+import pytest
+import requests
+
+pytest.importorskip("torch")
+
+from scrape_gpt.scraper import LlmScraper
+
+
+def test_fetch_html_rejects_errors_and_non_html(site):
+    base = site.base_url
+    with LlmScraper(load_retrieval_model=False, timeout=5) as scraper:
+        assert "leaf" in scraper.fetch_html(base + "/c")
+        with pytest.raises(requests.HTTPError):
+            scraper.fetch_html(base + "/missing")
+        with pytest.raises(ValueError):
+            scraper.fetch_html(base + "/logo.png")
+
+
+def page(second: str) -> str:
+    return (f"<html><body><div><p>fish price list</p></div><div><p>{second}</p></div>"
+            "<div><p>about the team</p></div></body></html>")
+
+
+def test_incremental_text_retrieval_reuses_unchanged_sections():
+    from scrape_gpt.benchmark import create_tiny_scraper
+
+    scraper = create_tiny_scraper()
+    embedded = []
+    embed_texts = scraper.embed_texts
+
+    def recording_embed_texts(texts):
+        embedded.extend(texts)
+        return embed_texts(texts)
+
+    scraper.embed_texts = recording_embed_texts
+    queries = ["product price"]
+
+    scraper.load(html=page("shipping and returns"))
+    first, snapshot = scraper.incremental_text_retrieval(queries, max_section_len=20)
+    assert len(embedded) == 4
+
+    embedded.clear()
+    scraper.load(html=page("free delivery offer"))
+    second, _ = scraper.incremental_text_retrieval(queries, snapshot, max_section_len=20)
+    # only the changed section and the query went through the model
+    assert embedded == ["retrieve similar product price", "free delivery offer"]
+
+    first_scores = dict((text, float(score)) for text, score in first[0][1])
+    second_scores = dict((text, float(score)) for text, score in second[0][1])
+    for text in ["fish price list", "about the team"]:
+        assert second_scores[text] == first_scores[text]
+
+
+def test_incremental_text_retrieval_caps_top_k():
+    from scrape_gpt.benchmark import create_tiny_scraper
+
+    scraper = create_tiny_scraper()
+    scraper.load(html=page("shipping and returns"))
+    results, _ = scraper.incremental_text_retrieval(["product price"], top_k=10)
+    assert len(results[0][1]) == 3
+
+    scraper.load(html="<html><body><script>render()</script></body></html>")
+    results, _ = scraper.incremental_text_retrieval(["product price"], top_k=10)
+    assert results[0][1] == []